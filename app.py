@@ -1,478 +1,1005 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, abort, jsonify, request
 import os
-import json
-import subprocess
+import hashlib
+import hmac
+import secrets
 import psutil
 from datetime import datetime
-import telebot
 from telebot import types
 import random
 import string
+import subprocess
 import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
 from waitress import serve
+from store import open_store, migrate_json
+from registry import Registry, ScriptRecord
+from supervisor import Supervisor, RestartTracker, RESTART_POLICIES, find_processes
+from limits import Limits
+from sampler import Sampler
+from logs import LogStore
+from pages import render, nav_markup, parse_page_data
+from outbox import Outbox, ProgressMessage, TelebotTransport
+from dispatch import Dispatcher, DispatchingBot
+from uploads import ContentStore, UploadTooLarge
+from launcher import ForkServer
+from envs import EnvBuilder, EnvBuildError, parse_requirements
+from metrics import Metrics
+from scheduler import Scheduler, CronSchedule, OVERLAP_POLICIES
 
 app = Flask(__name__)
 
 # Configuration
 TOKEN = os.getenv('TELEGRAM_TOKEN')
-bot = telebot.TeleBot(TOKEN)
+HANDLER_WORKERS = int(os.getenv('HANDLER_WORKERS', '8'))
+HANDLER_QUEUE = int(os.getenv('HANDLER_QUEUE', '1000'))
+# Updates run on a bounded pool, in order per chat
+dispatcher = Dispatcher(HANDLER_WORKERS, HANDLER_QUEUE)
+bot = DispatchingBot(TOKEN, dispatcher)
 ADMINS = os.getenv('ADMINS', '').split(',')
+RESTART_POLICY = os.getenv('RESTART_POLICY', 'never')
+RESTART_BACKOFF = float(os.getenv('RESTART_BACKOFF', '1'))
+RESTART_BACKOFF_MAX = float(os.getenv('RESTART_BACKOFF_MAX', '300'))
+# Restarts pause after CRASH_LOOP_RESTARTS runs in a row that together stayed up less than the window
+CRASH_LOOP_RESTARTS = int(os.getenv('CRASH_LOOP_RESTARTS', '5'))
+CRASH_LOOP_WINDOW = float(os.getenv('CRASH_LOOP_WINDOW', '60'))
+MAX_RUNNING_PER_USER = int(os.getenv('MAX_RUNNING_PER_USER', '0'))
+SAMPLE_INTERVAL = float(os.getenv('SAMPLE_INTERVAL', '5'))
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(1024 * 1024)))
+LOG_BACKUPS = int(os.getenv('LOG_BACKUPS', '3'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '10'))
+OUTBOX_GLOBAL_RATE = float(os.getenv('OUTBOX_GLOBAL_RATE', '30'))
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', '1'))
+OUTBOX_CHAT_BURST = int(os.getenv('OUTBOX_CHAT_BURST', '3'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))
+LAUNCHER = os.getenv('LAUNCHER', 'popen')
+PRELOAD_MODULES = os.getenv('PRELOAD_MODULES', '').split(',')
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(5 * 1024 * 1024)))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+# Telegram only accepts [A-Za-z0-9_-] here, and generated values (e.g. render's) are base64
+WEBHOOK_SECRET = hashlib.sha256((os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)).encode()).hexdigest()
+ENV_DIR = os.getenv('ENV_DIR', 'envs')
+ENV_BUILD_WORKERS = int(os.getenv('ENV_BUILD_WORKERS', '1'))
+ENV_BUILD_TIMEOUT = float(os.getenv('ENV_BUILD_TIMEOUT', '600'))
+RELAUNCH_ON_BOOT = os.getenv('RELAUNCH_ON_BOOT', 'false').lower() in ('1', 'true', 'yes')
+POLL_STALE_SECONDS = float(os.getenv('POLL_STALE_SECONDS', '90'))
+STOP_TIMEOUT = float(os.getenv('STOP_TIMEOUT', '5'))
+
+# Prometheus metrics, served at /metrics
+metrics = Metrics("scripthost_")
+handler_seconds = metrics.histogram("handler_seconds", "Telegram handler latency", ("handler",))
+store_seconds = metrics.histogram("store_seconds", "State store load/save duration", ("op",))
+store_bytes = metrics.counter("store_bytes_total", "Bytes read from or written to the state store", ("op",))
+store_lock_wait = metrics.histogram("store_lock_wait_seconds", "Time spent waiting for the state store lock")
+spawn_seconds = metrics.histogram("spawn_seconds", "Time to launch a hosted script", ("launcher",))
+
+# Outbound Telegram calls, rate limited and sent off the handler threads
+outbox = Outbox(TelebotTransport(bot), OUTBOX_GLOBAL_RATE, OUTBOX_CHAT_RATE, OUTBOX_CHAT_BURST,
+                workers=OUTBOX_WORKERS)
 
 # File system setup
 os.makedirs("scripts", exist_ok=True)
 USER_DATA_FILE = "user_data.json"
-if not os.path.exists(USER_DATA_FILE):
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump({}, f)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite')
+STATE_DB = os.getenv('STATE_DB', 'user_data.db')
+
+# Uploaded scripts, stored once per content hash
+uploads = ContentStore("scripts", MAX_UPLOAD_BYTES)
+
+# State store
+if STATE_BACKEND == "json":
+    state = open_store("json", USER_DATA_FILE)
+else:
+    state = open_store(STATE_BACKEND, STATE_DB)
+    migrated = migrate_json(USER_DATA_FILE, state)
+    if migrated:
+        print(f"📦 Migrated {migrated} scripts from {USER_DATA_FILE}")
 
-# Thread safety
-file_lock = threading.Lock()
+def observe_store(op, seconds, nbytes):
+    store_seconds.observe(seconds, op)
+    store_bytes.inc(nbytes, op)
+
+state.on_io = observe_store
+state.on_lock_wait = store_lock_wait.observe
+
+# In-memory script index, written through to the state store
+registry = Registry(state)
 
 def load_data():
-    with file_lock:
-        with open(USER_DATA_FILE, "r") as f:
-            return json.load(f)
+    return registry.snapshot()
 
 def save_data(data):
-    with file_lock:
-        with open(USER_DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
+    state.replace_all(data)
+    registry.load()
+
+# Hosted processes, reaped as they exit
+supervisor = Supervisor()
+restarts = RestartTracker(RESTART_BACKOFF, RESTART_BACKOFF_MAX, CRASH_LOOP_RESTARTS, CRASH_LOOP_WINDOW)
+limits = Limits.from_env()
+# Optional pre-warmed interpreter that hosted scripts fork from
+forkserver = ForkServer(PRELOAD_MODULES) if LAUNCHER == "forkserver" else None
+# Per-script virtualenvs for uploads that come with a requirements.txt
+envs = EnvBuilder(ENV_DIR, ENV_BUILD_WORKERS, ENV_BUILD_TIMEOUT)
+
+# Per-script stdout/stderr, written by the scripts themselves so a bot restart can't break their output
+script_logs = LogStore(LOG_DIR, LOG_MAX_BYTES, LOG_BACKUPS)
+
+# Process metrics, sampled in bulk off the handler threads
+sampler = Sampler(lambda: {r.pid: r.script_id for r in registry.with_status("running") if r.pid},
+                  SAMPLE_INTERVAL)
 
-running_scripts = {}
+def hosted_usage():
+    samples = [sampler.latest(r.script_id) for r in registry.with_status("running")]
+    return [sample for sample in samples if sample is not None]
+
+# Computed at scrape time only
+metrics.gauge("running_scripts", "Running scripts per user", ("user",),
+              lambda: {(uid,): running for uid, (running, _) in registry.users().items() if running})
+metrics.gauge("scripts", "Scripts by status", ("status",),
+              lambda: {(status,): count for status, count in Counter(r.status for r in registry.all()).items()})
+metrics.gauge("hosted_cpu_percent", "Total CPU of hosted process trees",
+              (), lambda: {(): sum(sample.cpu_percent for sample in hosted_usage())})
+metrics.gauge("hosted_rss_bytes", "Total RSS of hosted process trees",
+              (), lambda: {(): sum(sample.rss for sample in hosted_usage())})
+metrics.gauge("hosted_processes", "Processes in hosted trees",
+              (), lambda: {(): sum(sample.procs for sample in hosted_usage())})
+metrics.gauge("dispatch_queue_depth", "Updates waiting for or running on a handler",
+              (), lambda: {(): dispatcher.pending})
+metrics.gauge("outbox_pending", "Outbound Telegram calls not yet sent",
+              (), lambda: {(): outbox.pending()})
 
 def generate_script_id():
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    while True:
+        script_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+        if script_id not in registry:
+            return script_id
 
 def is_admin(user_id):
     return str(user_id) in ADMINS
 
-def cleanup_zombies():
-    data = load_data()
-    for user_id, scripts in list(data.items()):
-        for script_id, script_data in list(scripts.items()):
-            if script_data["status"] == "running":
-                try:
-                    process = psutil.Process(script_data["pid"])
-                    if not process.is_running():
-                        script_data["status"] = "stopped"
-                except psutil.NoSuchProcess:
-                    script_data["status"] = "stopped"
-    save_data(data)
-
-def run_script(user_id, script_id, script_path):
-    data = load_data()
-    if user_id not in data or script_id not in data[user_id]:
-        return
-    
-    process = subprocess.Popen(["python", script_path])
-    running_scripts[script_id] = process
-    data[user_id][script_id]["pid"] = process.pid
-    data[user_id][script_id]["status"] = "running"
-    data[user_id][script_id]["start_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    save_data(data)
+# Stop-then-start on one script must not interleave across threads: two launches would leave
+# one process untracked and out of reach of /stop. Reentrant, so helpers can nest
+script_locks = {}
+script_locks_guard = threading.Lock()
+
+def script_lock(script_id):
+    with script_locks_guard:
+        return script_locks.setdefault(script_id, threading.RLock())
+
+@contextmanager
+def locked_scripts(script_ids):
+    # Sorted so two batches never take the same locks in opposite orders; taken before
+    # registry.batch(), which holds the registry lock that run_script also needs
+    with ExitStack() as stack:
+        for script_id in sorted(set(script_ids)):
+            stack.enter_context(script_lock(script_id))
+        yield
+
+def adopt_orphans(records):
+    # Running records the supervisor doesn't know, checked against pid reuse; returns the adopted IDs
+    orphans = [r for r in records if r.pid and supervisor.get(r.script_id) is None]
+    alive = find_processes({r.pid: (r.extra.get("create_time"), r.extra.get("cmdline"), r.script_path)
+                            for r in orphans})
+    for record in orphans:
+        if record.pid in alive:
+            supervisor.adopt(record.script_id, record.pid, alive[record.pid])
+    return {r.script_id for r in orphans if r.pid in alive}
+
+def reconcile():
+    # Re-adopt scripts that outlived the previous bot process
+    records = registry.with_status("running")
+    # Backoff timers don't survive a restart, so scripts waiting on one are decided now
+    waiting = registry.with_status("restarting")
+    adopted = adopt_orphans(records)
+    relaunched = 0
+    with locked_scripts(r.script_id for r in records + waiting), registry.batch():
+        for record in records:
+            if record.script_id in adopted:
+                continue
+            if RELAUNCH_ON_BOOT and run_script(record.user_id, record.script_id, record.script_path):
+                relaunched += 1
+            else:
+                mark_stopped(record.script_id)
+        for record in waiting:
+            policy = record.extra.get("restart_policy", RESTART_POLICY)
+            if restarts.should_restart(policy, record.extra.get("exit_code")) and \
+                    run_script(record.user_id, record.script_id, record.script_path):
+                relaunched += 1
+            else:
+                mark_stopped(record.script_id)
+    if records or waiting:
+        print(f"♻️ Reconciled {len(records) + len(waiting)} scripts: "
+              f"{len(adopted)} adopted, {relaunched} relaunched")
+
+def stop_scripts(records):
+    # One SIGTERM wave and one deadline for all of them; returns {script_id: exit_code}
+    with locked_scripts(r.script_id for r in records):
+        adopt_orphans(records)
+        for record in records:
+            restarts.reset(record.script_id)
+            queued_runs.discard(record.script_id)
+        return supervisor.stop_many([r.script_id for r in records], STOP_TIMEOUT)
+
+def kill_process(script_id):
+    record = registry.get(script_id)
+    if record is None:
+        return None
+    return stop_scripts([record]).get(script_id)
+
+def stop_script(script_id):
+    with script_lock(script_id):
+        return mark_stopped(script_id, exit_code=kill_process(script_id))
+
+def restart_script(record):
+    # Returns False, with the script marked stopped, if the new run couldn't start
+    with script_lock(record.script_id):
+        kill_process(record.script_id)
+        if not run_script(record.user_id, record.script_id, record.script_path):
+            mark_stopped(record.script_id)
+            return False
+        return True
+
+def restart_scripts(records):
+    started = 0
+    with locked_scripts(r.script_id for r in records):
+        stop_scripts(records)
+        with registry.batch():
+            for record in records:
+                if run_script(record.user_id, record.script_id, record.script_path):
+                    started += 1
+                else:
+                    mark_stopped(record.script_id)
+    return started
+
+def on_script_exit(script_id, process, returncode, stopped, uptime):
+    limits.release(script_id)
+    record = registry.get(script_id)
+    if record is None or record.pid != process.pid:
+        # A restart already replaced this process
+        return
+    if stopped:
+        # The stop path records the exit code along with the status
+        return
+    
+    end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    policy = record.extra.get("restart_policy", RESTART_POLICY)
+    if restarts.should_restart(policy, returncode):
+        delay = restarts.next_delay(script_id, uptime)
+        if delay is not None:
+            registry.update(script_id, status="restarting", exit_code=returncode, end_time=end_time)
+            supervisor.call_later(script_id, delay, auto_restart, script_id)
+            return
+        registry.update(script_id, status="crashed", exit_code=returncode, end_time=end_time)
+        exit_code = f"exit code {returncode}" if returncode is not None else "exit code unknown"
+        outbox.send_message(record.user_id, f"⚠️ Script `{script_id}` is crash-looping "
+                         f"({exit_code}), automatic restarts paused.\n"
+                         f"Use /restart {script_id} once it's fixed.", parse_mode="Markdown")
+        return
+    
+    # Adopted scripts aren't our children, so their exit code went elsewhere: record it as
+    # unknown rather than calling every one of those exits a crash
+    registry.update(script_id, status="crashed" if returncode not in (0, None) else "exited",
+                    exit_code=returncode, end_time=end_time)
+    if script_id in queued_runs:
+        # A scheduled run came due while this one was still going
+        queued_runs.discard(script_id)
+        run_unless_busy(script_id, lambda: run_script(record.user_id, script_id, record.script_path))
+
+def run_unless_busy(script_id, fn):
+    # For the supervisor loop: waiting there for a handler that is itself waiting on the loop
+    # to reap would stall every script. A busy lock means someone is stopping or restarting
+    # this script right now, which supersedes the automatic run
+    lock = script_lock(script_id)
+    if lock.acquire(blocking=False):
+        try:
+            fn()
+        finally:
+            lock.release()
+
+def auto_restart(script_id):
+    def restart():
+        record = registry.get(script_id)
+        if record is not None and record.status == "restarting":
+            if not run_script(record.user_id, script_id, record.script_path):
+                registry.update(script_id, status="stopped")
+    run_unless_busy(script_id, restart)
+
+def run_scheduled(script_id):
+    # Runs on the handler pool, in the owner's lane, once the scheduler says a job is due
+    record = registry.get(script_id)
+    if record is None:
+        scheduler.remove(script_id)
+        return
+    with script_lock(script_id):
+        if record.status in ("running", "restarting", "building"):
+            overlap = record.extra.get("overlap", "skip")
+            if overlap == "skip":
+                return
+            if overlap == "queue":
+                queued_runs.add(script_id)
+                return
+        if restart_script(record):
+            return
+    outbox.send_message(record.user_id, f"⏰ Scheduled run of `{script_id}` skipped.\n"
+                        f"{not_started_message(record.user_id, script_id)}", parse_mode="Markdown")
+
+def schedule_due(script_id):
+    # Same lane key as update_key (the int chat id), so scheduled runs queue behind the owner's commands
+    owner = registry.owner(script_id)
+    if not dispatcher.submit(int(owner) if owner is not None else None, run_scheduled, script_id, block=False):
+        print(f"⚠️ Handler queue full, skipped scheduled run of {script_id}")
+
+# Periodic jobs: one thread sleeping until the earliest due run, instead of resident processes
+scheduler = Scheduler(schedule_due)
+queued_runs = set()
+
+supervisor.on_exit = on_script_exit
+
+def mark_stopped(script_id, **fields):
+    return registry.update(script_id, status="stopped",
+                           end_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **fields)
+
+def find_script(user_id, script_id, admin):
+    # Admins may address any script, users only their own
+    record = registry.get(script_id)
+    if record is None or (not admin and record.user_id != user_id):
+        return None
+    return record
+
+def user_quota(user_id):
+    return state.get_setting(f"quota:{user_id}", MAX_RUNNING_PER_USER)
+
+def quota_exceeded(user_id, script_id):
+    quota = user_quota(user_id)
+    if not quota or is_admin(user_id):
+        return False
+    running = sum(1 for r in registry.for_user(user_id, status="running") if r.script_id != script_id)
+    return running >= quota
+
+def run_script(user_id, script_id, script_path, script_limits=None):
+    with script_lock(script_id):
+        return _run_script(user_id, script_id, script_path, script_limits)
+
+def _run_script(user_id, script_id, script_path, script_limits):
+    record = registry.get(script_id)
+    if record is None or record.user_id != user_id:
+        return False
+    if quota_exceeded(user_id, script_id):
+        return False
+    if supervisor.get(script_id) is not None:
+        # Never track two processes under one id; callers normally stop it first
+        stop_scripts([record])
+    
+    script_limits = script_limits or limits
+    cgroup = script_limits.cgroup(script_id)
+    # Scripts with their own virtualenv can't fork from the bot's interpreter
+    env = record.extra.get("env")
+    python = envs.env_python(env) if env else "python"
+    process = None
+    try:
+        # The script holds its own log descriptor, so its output doesn't depend on the bot staying up
+        output = script_logs.open(script_id)
+    except OSError as e:
+        print(f"⚠️ Could not open the log for {script_id}: {e}")
+        mark_stopped(script_id)
+        return False
+    try:
+        started = time.perf_counter()
+        if forkserver is not None and not env:
+            try:
+                process = forkserver.launch(script_path, output, script_limits.rlimits(), script_limits.nice, cgroup)
+                supervisor.watch(script_id, process)
+                spawn_seconds.observe(time.perf_counter() - started, "forkserver")
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"⚠️ Forkserver launch failed, using a fresh interpreter: {e}")
+                process = None
+        if process is None:
+            started = time.perf_counter()
+            # command() limits the child from inside before any script code runs, as the forkserver child does
+            try:
+                process = supervisor.spawn(script_id, script_limits.command([python, script_path], cgroup),
+                                           start_new_session=True, stdin=subprocess.DEVNULL,
+                                           stdout=output, stderr=subprocess.STDOUT)
+            except OSError as e:
+                # Same outcome as a refused start: callers reply, nothing is left half-started
+                print(f"⚠️ Could not launch {script_id}: {e}")
+                mark_stopped(script_id)
+                return False
+            spawn_seconds.observe(time.perf_counter() - started, "popen")
+            # The shim execs [python, script_path] in place, which is the command line found after a restart
+            cmdline = [python, script_path]
+        else:
+            cmdline = None
+    finally:
+        os.close(output)
+    script_limits.apply_ionice(process.pid)
+    # Identifies this exact process again after a bot restart, even if the pid gets reused
+    try:
+        info = psutil.Process(process.pid)
+        with info.oneshot():
+            identity = {"create_time": info.create_time(), "cmdline": cmdline or info.cmdline()}
+    except psutil.Error:
+        identity = {}
+    registry.update(script_id, pid=process.pid, status="running",
+                    start_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **identity)
+    return True
+
+def build_env(chat_id, script_id, requirements_path):
+    # The build runs on the env builder pool; the script (re)starts once its interpreter exists
+    progress = ProgressMessage(outbox, chat_id, f"⏳ Preparing environment for {script_id}…")
+    with open(requirements_path) as f:
+        future = envs.build(registry.owner(script_id), f.read(), progress.update)
+    future.add_done_callback(lambda f: env_ready(script_id, progress, f))
+
+def env_ready(script_id, progress, future):
+    record = registry.get(script_id)
+    if record is None:
+        return
+    try:
+        env = future.result()
+    except Exception as e:
+        if record.status == "building":
+            mark_stopped(script_id)
+        progress.update(f"❌ Environment build for {script_id} failed: {e}")
+        return
+    
+    registry.update(script_id, env=env)
+    with script_lock(script_id):
+        # Checked under the lock, so a /stop that lands meanwhile isn't undone
+        wanted = record.status in ("building", "running")
+        started = wanted and restart_script(record)
+    if not wanted:
+        progress.update(f"✅ Environment for {script_id} is ready")
+        return
+    if not started:
+        progress.update(f"✅ Environment for {script_id} is ready, but it was not started.\n"
+                        f"{not_started_message(record.user_id, script_id)}")
+        return
+    progress.update(f"✅ Environment ready, {script_id} is running")
+
+@lru_cache(maxsize=4096)
+def parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+def uptime(record):
+    return str(datetime.now() - parse_time(record.start_time)).split('.')[0]
+
+def format_usage(record):
+    sample = sampler.latest(record.script_id)
+    if sample is None:
+        return ""
+    return (f"📈 *CPU:* {sample.cpu_percent:.1f}% · *RAM:* {sample.rss / 1024 / 1024:.1f} MB"
+            f" · *Threads:* {sample.threads}\n")
+
+def quota_message(user_id):
+    return f"🚫 Quota reached: at most {user_quota(user_id)} running scripts per user"
+
+def not_started_message(user_id, script_id):
+    # run_script returns False for a full quota or a failed launch
+    if quota_exceeded(user_id, script_id):
+        return quota_message(user_id)
+    return "⚠️ The script could not be launched, please try again later"
 
 @bot.message_handler(commands=['start'])
+@handler_seconds.time("start")
 def start(message):
     if is_admin(message.chat.id):
-        bot.send_message(message.chat.id, "👑 *Admin Panel* 👑\n\n"
+        outbox.send_message(message.chat.id, "👑 *Admin Panel* 👑\n\n"
                          "You have full control over all scripts.\n\n"
                          "📋 *Admin Commands:*\n"
                          "/host - Upload script\n"
-                         "/status - All running scripts\n"
+                         "/status [user_id] - All running scripts\n"
                          "/stop <script_id> - Stop any script\n"
-                         "/restart <script_id> - Restart any script\n"
-                         "/list - List all scripts\n"
+                         "/restart <script_id|all> - Restart any script\n"
+                         "/list [user_id] [status] - List all scripts\n"
                          "/users - List all users\n"
+                         "/logs <script_id> [lines] - Show script output\n"
+                         "/policy <script_id> <policy> - Set restart policy\n"
+                         "/quota <user_id> [max_running] - Running script quota\n"
+                         "/schedule [script_id cron|off] - Periodic runs\n"
+                         "/requirements [clear] - Default requirements.txt\n"
                          "/killall - Stop all scripts", parse_mode="Markdown")
     else:
-        bot.send_message(message.chat.id, "🌟 *Welcome to Python Script Hosting Bot!* 🌟\n\n"
-                         "Upload `.py` files to host and execute them.\n\n"
+        outbox.send_message(message.chat.id, "🌟 *Welcome to Python Script Hosting Bot!* 🌟\n\n"
+                         "Upload `.py` files to host and execute them.\n"
+                         "Send a `requirements.txt` first to run your scripts in their own virtualenv, "
+                         "or with a script ID as caption to add packages to that script.\n\n"
                          "📋 *Commands:*\n"
                          "/host - Upload script\n"
                          "/status - Your running scripts\n"
                          "/stop <script_id> - Stop your script\n"
-                         "/restart <script_id> - Restart your script", parse_mode="Markdown")
+                         "/restart <script_id|all> - Restart your scripts\n"
+                         "/logs <script_id> [lines] - Show script output\n"
+                         "/policy <script_id> <never|on-failure|always> - Auto-restart\n"
+                         "/schedule <script_id> <cron> [skip|queue|replace] - Run periodically\n"
+                         "/schedule <script_id> off - Stop periodic runs\n"
+                         "/requirements [clear] - Your default requirements.txt", parse_mode="Markdown")
 
 @bot.message_handler(commands=['host'])
+@handler_seconds.time("host")
 def host(message):
-    bot.send_message(message.chat.id, "📤 Please upload a `.py` file:")
+    outbox.send_message(message.chat.id, "📤 Please upload a `.py` file:")
+
+def format_running(record, admin):
+    text = f"👤 *User:* {record.user_id}\n" if admin else ""
+    text += f"🆔 *ID:* `{record.script_id}`\n"
+    text += f"📂 *File:* `{record.file_name}`\n"
+    text += format_usage(record)
+    text += f"⏱ *Uptime:* {uptime(record)}\n\n"
+    return text
+
+def format_script(record):
+    status_emoji = "🟢" if record.status == "running" else "🔴"
+    text = f"👤 *User:* {record.user_id}\n"
+    text += f"🆔 *ID:* `{record.script_id}`\n"
+    text += f"📂 *File:* `{record.file_name}`\n"
+    text += f"🔄 *Status:* {status_emoji} {record.status.capitalize()}\n"
+    if record.start_time:
+        text += f"⏱ *Started:* {record.start_time}\n"
+    if record.extra.get("schedule"):
+        text += f"⏰ *Schedule:* `{record.extra['schedule']}`\n"
+    if record.status == "running":
+        text += format_usage(record)
+    return text + "\n"
+
+def format_schedule(record):
+    next_run = scheduler.next_run(record.script_id)
+    text = f"🆔 *ID:* `{record.script_id}` · `{record.file_name}`\n"
+    text += f"⏰ `{record.extra['schedule']}` · overlap: {record.extra.get('overlap', 'skip')}\n"
+    text += f"⏭ *Next run:* {next_run:%Y-%m-%d %H:%M}\n\n" if next_run else "⏭ *Next run:* never\n\n"
+    return text
+
+def format_user(item):
+    uid, (running, total) = item
+    return f"👤 *User ID:* {uid}\n📊 Scripts: {running} running / {total} total\n\n"
+
+def parse_filters(args):
+    user_filter = status_filter = None
+    for arg in args:
+        if arg.lstrip("-").isdigit():
+            user_filter = arg
+        else:
+            status_filter = arg.lower()
+    return user_filter, status_filter
+
+def render_view(view, chat_id, page, user_filter=None, status_filter=None):
+    # Returns (text, markup), or None if the chat may not open this view
+    admin = is_admin(chat_id)
+    if view == "status":
+        if not admin:
+            user_filter = str(chat_id)
+        if user_filter:
+            items = registry.for_user(user_filter, status="running")
+        else:
+            items = registry.with_status("running")
+        if not items:
+            return "💤 No running scripts found.", None
+        header = "👑 *All Running Scripts:* 👑\n\n" if admin else "📊 *Your Running Scripts:*\n\n"
+        text, page, pages = render(header, items, page, PAGE_SIZE, lambda r: format_running(r, admin))
+    elif view == "list" and admin:
+        if user_filter:
+            items = registry.for_user(user_filter, status=status_filter)
+        elif status_filter:
+            items = registry.with_status(status_filter)
+        else:
+            items = registry.all()
+        if not items:
+            return "📭 No scripts found.", None
+        text, page, pages = render("📜 *All Scripts:* 📜\n\n", items, page, PAGE_SIZE, format_script)
+    elif view == "schedules":
+        if not admin:
+            user_filter = str(chat_id)
+        records = registry.for_user(user_filter) if user_filter else registry.all()
+        items = [r for r in records if r.extra.get("schedule")]
+        if not items:
+            return "📭 No scheduled scripts.", None
+        text, page, pages = render("⏰ *Scheduled Scripts:*\n\n", items, page, PAGE_SIZE, format_schedule)
+    elif view == "users" and admin:
+        items = list(registry.users().items())
+        if not items:
+            return "📭 No users yet.", None
+        text, page, pages = render("👥 *Registered Users:* 👥\n\n", items, page, PAGE_SIZE, format_user)
+    else:
+        return None
+    return text, nav_markup(view, page, pages, user_filter, status_filter)
+
+def send_view(message, view):
+    user_filter, status_filter = parse_filters(message.text.split()[1:])
+    rendered = render_view(view, message.chat.id, 1, user_filter, status_filter)
+    if rendered is None:
+        outbox.send_message(message.chat.id, "❌ Admin only command")
+        return
+    text, markup = rendered
+    outbox.send_message(message.chat.id, text, reply_markup=markup, parse_mode="Markdown")
 
 @bot.message_handler(commands=['status'])
+@handler_seconds.time("status")
 def status(message):
-    user_id = str(message.chat.id)
-    data = load_data()
-    
-    if is_admin(message.chat.id):
-        response = "👑 *All Running Scripts:* 👑\n\n"
-        for uid, scripts in data.items():
-            for script_id, script_data in scripts.items():
-                if script_data["status"] == "running":
-                    duration = datetime.now() - datetime.strptime(script_data["start_time"], "%Y-%m-%d %H:%M:%S")
-                    response += f"👤 *User:* {uid}\n"
-                    response += f"🆔 *ID:* `{script_id}`\n"
-                    response += f"📂 *File:* `{script_data['file_name']}`\n"
-                    response += f"⏱ *Uptime:* {str(duration).split('.')[0]}\n\n"
-    else:
-        response = "📊 *Your Running Scripts:*\n\n"
-        if user_id in data:
-            for script_id, script_data in data[user_id].items():
-                if script_data["status"] == "running":
-                    duration = datetime.now() - datetime.strptime(script_data["start_time"], "%Y-%m-%d %H:%M:%S")
-                    response += f"🆔 *ID:* `{script_id}`\n"
-                    response += f"📂 *File:* `{script_data['file_name']}`\n"
-                    response += f"⏱ *Uptime:* {str(duration).split('.')[0]}\n\n"
-    
-    if response.count("\n") < 3:
-        response = "💤 No running scripts found."
-    
-    bot.send_message(message.chat.id, response, parse_mode="Markdown")
+    send_view(message, "status")
 
 @bot.message_handler(commands=['list'])
+@handler_seconds.time("list_scripts")
 def list_scripts(message):
-    if not is_admin(message.chat.id):
-        bot.send_message(message.chat.id, "❌ Admin only command")
-        return
-    
-    data = load_data()
-    response = "📜 *All Scripts:* 📜\n\n"
-    for uid, scripts in data.items():
-        response += f"👤 *User:* {uid}\n"
-        for script_id, script_data in scripts.items():
-            status_emoji = "🟢" if script_data["status"] == "running" else "🔴"
-            response += f"🆔 *ID:* `{script_id}`\n"
-            response += f"📂 *File:* `{script_data['file_name']}`\n"
-            response += f"🔄 *Status:* {status_emoji} {script_data['status'].capitalize()}\n"
-            if "start_time" in script_data:
-                response += f"⏱ *Started:* {script_data['start_time']}\n"
-            response += "\n"
-    
-    bot.send_message(message.chat.id, response, parse_mode="Markdown")
+    send_view(message, "list")
 
 @bot.message_handler(commands=['users'])
+@handler_seconds.time("list_users")
 def list_users(message):
-    if not is_admin(message.chat.id):
-        bot.send_message(message.chat.id, "❌ Admin only command")
-        return
-    
-    data = load_data()
-    response = "👥 *Registered Users:* 👥\n\n"
-    for uid in data.keys():
-        response += f"👤 *User ID:* {uid}\n"
-        running = sum(1 for s in data[uid].values() if s["status"] == "running")
-        total = len(data[uid])
-        response += f"📊 Scripts: {running} running / {total} total\n\n"
-    
-    bot.send_message(message.chat.id, response, parse_mode="Markdown")
+    send_view(message, "users")
 
 @bot.message_handler(commands=['killall'])
+@handler_seconds.time("kill_all")
 def kill_all(message):
     if not is_admin(message.chat.id):
-        bot.send_message(message.chat.id, "❌ Admin only command")
-        return
-    
-    data = load_data()
-    count = 0
-    for uid, scripts in data.items():
-        for script_id, script_data in list(scripts.items()):
-            if script_data["status"] == "running":
-                if script_id in running_scripts:
-                    process = running_scripts[script_id]
-                    try:
-                        parent = psutil.Process(process.pid)
-                        for child in parent.children(recursive=True):
-                            child.kill()
-                        parent.kill()
-                    except psutil.NoSuchProcess:
-                        pass
-                    del running_scripts[script_id]
-                script_data["status"] = "stopped"
-                script_data["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                count += 1
-    
-    save_data(data)
-    bot.send_message(message.chat.id, f"🛑 Stopped all {count} running scripts")
+        outbox.send_message(message.chat.id, "❌ Admin only command")
+        return
+    
+    # Scripts waiting on a restart timer or an env build would otherwise come back on their own
+    records = registry.with_status("running", "restarting", "building")
+    with locked_scripts(r.script_id for r in records):
+        exit_codes = stop_scripts(records)
+        with registry.batch():
+            for record in records:
+                if record.script_id in exit_codes:
+                    mark_stopped(record.script_id, exit_code=exit_codes[record.script_id])
+                else:
+                    mark_stopped(record.script_id)
+    
+    outbox.send_message(message.chat.id, f"🛑 Stopped all {len(records)} active scripts")
 
 @bot.message_handler(commands=['stop'])
+@handler_seconds.time("stop")
 def stop(message):
     try:
         script_id = message.text.split()[1]
         user_id = str(message.chat.id)
-        data = load_data()
+        admin = is_admin(message.chat.id)
         
-        found = False
-        if is_admin(message.chat.id):
-            for uid, scripts in data.items():
-                if script_id in scripts:
-                    found = True
-                    if script_id in running_scripts:
-                        process = running_scripts[script_id]
-                        try:
-                            parent = psutil.Process(process.pid)
-                            for child in parent.children(recursive=True):
-                                child.kill()
-                            parent.kill()
-                        except psutil.NoSuchProcess:
-                            pass
-                        del running_scripts[script_id]
-                    scripts[script_id]["status"] = "stopped"
-                    scripts[script_id]["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    bot.send_message(message.chat.id, f"👑 Admin stopped script `{script_id}`", parse_mode="Markdown")
-        elif user_id in data and script_id in data[user_id]:
-            found = True
-            if script_id in running_scripts:
-                process = running_scripts[script_id]
-                try:
-                    parent = psutil.Process(process.pid)
-                    for child in parent.children(recursive=True):
-                        child.kill()
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-                del running_scripts[script_id]
-            data[user_id][script_id]["status"] = "stopped"
-            data[user_id][script_id]["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            bot.send_message(message.chat.id, f"🛑 Stopped your script `{script_id}`", parse_mode="Markdown")
+        record = find_script(user_id, script_id, admin)
+        if not record:
+            outbox.send_message(message.chat.id, "❌ Script not found")
+            return
         
-        if not found:
-            bot.send_message(message.chat.id, "❌ Script not found")
+        stop_script(script_id)
+        if admin:
+            outbox.send_message(message.chat.id, f"👑 Admin stopped script `{script_id}`", parse_mode="Markdown")
         else:
-            save_data(data)
+            outbox.send_message(message.chat.id, f"🛑 Stopped your script `{script_id}`", parse_mode="Markdown")
     except IndexError:
-        bot.send_message(message.chat.id, "ℹ️ Usage: /stop <script_id>")
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /stop <script_id>")
 
 @bot.message_handler(commands=['restart'])
+@handler_seconds.time("restart")
 def restart(message):
     try:
         script_id = message.text.split()[1]
         user_id = str(message.chat.id)
-        data = load_data()
+        admin = is_admin(message.chat.id)
+        
+        if script_id == "all":
+            # Includes scripts waiting on a restart timer, so the timer can't start a second copy
+            if admin:
+                records = registry.with_status("running", "restarting")
+            else:
+                records = [r for r in registry.for_user(user_id) if r.status in ("running", "restarting")]
+            started = restart_scripts(records)
+            outbox.send_message(message.chat.id, f"🔄 Restarted {started} of {len(records)} scripts")
+            return
         
-        found = False
-        if is_admin(message.chat.id):
-            for uid, scripts in data.items():
-                if script_id in scripts:
-                    found = True
-                    script_data = scripts[script_id]
-                    if script_id in running_scripts:
-                        process = running_scripts[script_id]
-                        try:
-                            parent = psutil.Process(process.pid)
-                            for child in parent.children(recursive=True):
-                                child.kill()
-                            parent.kill()
-                        except psutil.NoSuchProcess:
-                            pass
-                        del running_scripts[script_id]
-                    
-                    script_path = script_data["script_path"]
-                    run_script(uid, script_id, script_path)
-                    bot.send_message(message.chat.id, f"👑 Admin restarted script `{script_id}`", parse_mode="Markdown")
-        elif user_id in data and script_id in data[user_id]:
-            found = True
-            script_data = data[user_id][script_id]
-            if script_id in running_scripts:
-                process = running_scripts[script_id]
-                try:
-                    parent = psutil.Process(process.pid)
-                    for child in parent.children(recursive=True):
-                        child.kill()
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-                del running_scripts[script_id]
-            
-            script_path = script_data["script_path"]
-            run_script(user_id, script_id, script_path)
-            bot.send_message(message.chat.id, f"🔄 Restarted your script `{script_id}`", parse_mode="Markdown")
+        record = find_script(user_id, script_id, admin)
+        if not record:
+            outbox.send_message(message.chat.id, "❌ Script not found")
+            return
         
-        if not found:
-            bot.send_message(message.chat.id, "❌ Script not found")
+        if not restart_script(record):
+            outbox.send_message(message.chat.id, not_started_message(record.user_id, script_id))
+            return
+        if admin:
+            outbox.send_message(message.chat.id, f"👑 Admin restarted script `{script_id}`", parse_mode="Markdown")
         else:
-            save_data(data)
+            outbox.send_message(message.chat.id, f"🔄 Restarted your script `{script_id}`", parse_mode="Markdown")
     except IndexError:
-        bot.send_message(message.chat.id, "ℹ️ Usage: /restart <script_id>")
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /restart <script_id|all>")
+
+@bot.message_handler(commands=['policy'])
+@handler_seconds.time("policy")
+def policy(message):
+    try:
+        _, script_id, restart_policy = message.text.split()[:3]
+    except ValueError:
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /policy <script_id> <never|on-failure|always>")
+        return
+    
+    if restart_policy not in RESTART_POLICIES:
+        outbox.send_message(message.chat.id, "❌ Policy must be one of: never, on-failure, always")
+        return
+    
+    record = find_script(str(message.chat.id), script_id, is_admin(message.chat.id))
+    if not record:
+        outbox.send_message(message.chat.id, "❌ Script not found")
+        return
+    
+    restarts.reset(script_id)
+    registry.update(script_id, restart_policy=restart_policy)
+    outbox.send_message(message.chat.id, f"♻️ Restart policy for `{script_id}` set to *{restart_policy}*",
+                     parse_mode="Markdown")
+
+@bot.message_handler(commands=['schedule'])
+@handler_seconds.time("schedule")
+def schedule(message):
+    args = message.text.split()[1:]
+    if not args or args[0].lstrip("-").isdigit():
+        send_view(message, "schedules")
+        return
+    if len(args) < 2:
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /schedule <script_id> <cron> [skip|queue|replace]\n"
+                            "or /schedule <script_id> off")
+        return
+    
+    script_id = args[0]
+    record = find_script(str(message.chat.id), script_id, is_admin(message.chat.id))
+    if not record:
+        outbox.send_message(message.chat.id, "❌ Script not found")
+        return
+    
+    if args[1:] == ["off"]:
+        scheduler.remove(script_id)
+        queued_runs.discard(script_id)
+        registry.update(script_id, schedule=None, overlap=None)
+        outbox.send_message(message.chat.id, f"⏰ Schedule for `{script_id}` removed", parse_mode="Markdown")
+        return
+    
+    overlap = args[-1] if args[-1] in OVERLAP_POLICIES else "skip"
+    expression = " ".join(args[1:-1] if args[-1] in OVERLAP_POLICIES else args[1:])
+    try:
+        cron = CronSchedule(expression)
+    except ValueError as e:
+        outbox.send_message(message.chat.id, f"❌ {e}\nExample: /schedule {script_id} */15 * * * *")
+        return
+    if cron.next_after(datetime.now()) is None:
+        outbox.send_message(message.chat.id, "❌ That schedule never fires")
+        return
+    
+    registry.update(script_id, schedule=cron.expression, overlap=overlap)
+    next_run = scheduler.add(script_id, cron)
+    text = (f"⏰ `{script_id}` runs on `{cron.expression}` (overlap: {overlap})\n"
+            f"⏭ Next run: {next_run:%Y-%m-%d %H:%M} server time")
+    if record.status == "running":
+        text += "\nIt's running right now; /stop it if it doesn't need to stay up between runs."
+    outbox.send_message(message.chat.id, text, parse_mode="Markdown")
+
+@bot.message_handler(commands=['logs'])
+@handler_seconds.time("show_logs")
+def show_logs(message):
+    args = message.text.split()[1:]
+    if not args or (len(args) > 1 and not args[1].isdigit()):
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /logs <script_id> [lines]")
+        return
+    
+    script_id = args[0]
+    record = find_script(str(message.chat.id), script_id, is_admin(message.chat.id))
+    if not record:
+        outbox.send_message(message.chat.id, "❌ Script not found")
+        return
+    
+    lines = min(int(args[1]) if len(args) > 1 else 20, 200)
+    output = "\n".join(script_logs.tail(script_id, lines)).replace("`", "'")
+    if not output:
+        outbox.send_message(message.chat.id, f"📭 No output from `{script_id}` yet", parse_mode="Markdown")
+        return
+    # Keep the newest output within Telegram's message size
+    output = output[-3800:]
+    outbox.send_message(message.chat.id, f"📜 *Logs for* `{script_id}`:\n```\n{output}\n```", parse_mode="Markdown")
+
+@bot.message_handler(commands=['quota'])
+@handler_seconds.time("quota")
+def quota(message):
+    if not is_admin(message.chat.id):
+        outbox.send_message(message.chat.id, "❌ Admin only command")
+        return
+    
+    args = message.text.split()[1:]
+    if not args or (len(args) > 1 and not args[1].isdigit()):
+        outbox.send_message(message.chat.id, "ℹ️ Usage: /quota <user_id> [max_running]")
+        return
+    
+    uid = args[0]
+    if len(args) > 1:
+        state.set_setting(f"quota:{uid}", int(args[1]))
+    limit = user_quota(uid)
+    running = len(registry.for_user(uid, status="running"))
+    outbox.send_message(message.chat.id, f"📏 User {uid}: {running} running / "
+                     f"{limit if limit else 'unlimited'} allowed")
+
+@bot.message_handler(commands=['requirements'])
+@handler_seconds.time("requirements")
+def requirements(message):
+    user_id = str(message.chat.id)
+    if message.text.split()[1:2] == ["clear"]:
+        state.set_setting(f"requirements:{user_id}", None)
+        outbox.send_message(message.chat.id, "🧹 New uploads will use the shared interpreter again")
+        return
+    
+    path = state.get_setting(f"requirements:{user_id}")
+    if not path:
+        outbox.send_message(message.chat.id, "📭 No default requirements. Upload a `requirements.txt` to set one.",
+                            parse_mode="Markdown")
+        return
+    with open(path) as f:
+        packages = "\n".join(parse_requirements(f.read())).replace("`", "'")
+    outbox.send_message(message.chat.id, f"📦 *Default requirements:*\n```\n{packages or '(empty)'}\n```\n"
+                        f"Use /requirements clear to drop them.", parse_mode="Markdown")
+
+def attach_requirements(message, requirements_path):
+    user_id = str(message.chat.id)
+    try:
+        with open(requirements_path) as f:
+            parse_requirements(f.read())
+    except EnvBuildError as e:
+        outbox.send_message(message.chat.id, f"❌ {e}")
+        return
+    except UnicodeDecodeError:
+        outbox.send_message(message.chat.id, "❌ requirements.txt must be UTF-8 text")
+        return
+    
+    # A script ID caption targets that script, otherwise it's the default for later uploads
+    script_id = (message.caption or "").strip()
+    if script_id:
+        record = find_script(user_id, script_id, is_admin(message.chat.id))
+        if not record:
+            outbox.send_message(message.chat.id, "❌ Script not found")
+            return
+        registry.update(script_id, requirements=requirements_path)
+        build_env(message.chat.id, script_id, requirements_path)
+        return
+    
+    state.set_setting(f"requirements:{user_id}", requirements_path)
+    outbox.send_message(message.chat.id, "📦 Requirements saved. Scripts you upload from now on get their own "
+                        "virtualenv; use /requirements clear to stop.")
 
 @bot.message_handler(content_types=['document'])
+@handler_seconds.time("handle_file")
 def handle_file(message):
-    if not message.document.file_name.endswith('.py'):
-        bot.send_message(message.chat.id, "❌ Only `.py` files accepted")
+    file_name = message.document.file_name or ""
+    is_requirements = file_name.endswith('requirements.txt')
+    if not file_name.endswith('.py') and not is_requirements:
+        outbox.send_message(message.chat.id, "❌ Only `.py` files and `requirements.txt` accepted")
+        return
+    
+    if (message.document.file_size or 0) > MAX_UPLOAD_BYTES:
+        outbox.send_message(message.chat.id, f"❌ File too large (max {MAX_UPLOAD_BYTES // 1024} KB)")
         return
     
     user_id = str(message.chat.id)
     file_id = message.document.file_id
-    file_name = message.document.file_name
-    script_id = generate_script_id()
-    script_dir = os.path.join("scripts", user_id)
-    os.makedirs(script_dir, exist_ok=True)
-    script_path = os.path.join(script_dir, file_name)
     
     file_info = bot.get_file(file_id)
-    downloaded_file = bot.download_file(file_info.file_path)
-    
-    with open(script_path, 'wb') as f:
-        f.write(downloaded_file)
-    
-    data = load_data()
-    if user_id not in data:
-        data[user_id] = {}
+    try:
+        sha256, script_path, size = uploads.download(TOKEN, file_info.file_path,
+                                                     ".txt" if is_requirements else ".py")
+    except UploadTooLarge:
+        outbox.send_message(message.chat.id, f"❌ File too large (max {MAX_UPLOAD_BYTES // 1024} KB)")
+        return
+    if is_requirements:
+        attach_requirements(message, script_path)
+        return
     
-    data[user_id][script_id] = {
-        "file_name": file_name,
-        "script_path": script_path,
-        "status": "pending",
-        "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_data(data)
+    script_id = generate_script_id()
+    # Each upload is a new immutable version; running scripts keep their own file
+    version = 1 + max((r.extra.get("version", 1) for r in registry.for_user(user_id)
+                       if r.file_name == file_name), default=0)
+    extra = {"restart_policy": RESTART_POLICY, "sha256": sha256, "size": size, "version": version}
+    requirements_path = state.get_setting(f"requirements:{user_id}")
+    if requirements_path:
+        extra["requirements"] = requirements_path
+    registry.add(ScriptRecord(
+        user_id, script_id,
+        file_name=file_name,
+        script_path=script_path,
+        status="building" if requirements_path else "pending",
+        upload_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        extra=extra
+    ))
     
-    run_script(user_id, script_id, script_path)
+    if requirements_path:
+        build_env(message.chat.id, script_id, requirements_path)
+    elif not run_script(user_id, script_id, script_path):
+        registry.update(script_id, status="stopped")
+        outbox.send_message(message.chat.id, f"📥 Saved `{file_name}` as `{script_id}`, but it was not started.\n"
+                         f"{not_started_message(user_id, script_id)}", parse_mode="Markdown")
+        return
     
     markup = types.InlineKeyboardMarkup(row_width=2)
     stop_btn = types.InlineKeyboardButton("🛑 Stop", callback_data=f"stop_{script_id}")
     restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
     markup.add(stop_btn, restart_btn)
     
-    bot.send_message(message.chat.id, f"✨ *Script Hosted Successfully!* ✨\n\n"
+    outbox.send_message(message.chat.id, f"✨ *Script Hosted Successfully!* ✨\n\n"
                     f"🆔 *ID:* `{script_id}`\n"
-                    f"📂 *File:* `{file_name}`\n"
-                    f"🔄 *Status:* 🟢 Running",
+                    f"📂 *File:* `{file_name}` (v{version})\n"
+                    f"🔄 *Status:* {'⏳ Building environment' if requirements_path else '🟢 Running'}",
                     reply_markup=markup, parse_mode="Markdown")
 
 @bot.callback_query_handler(func=lambda call: True)
+@handler_seconds.time("callback_handler")
 def callback_handler(call):
     user_id = str(call.message.chat.id)
-    data = load_data()
+    admin = is_admin(call.message.chat.id)
     
     if call.data.startswith("stop_"):
         script_id = call.data.split("_")[1]
         
-        if is_admin(call.message.chat.id):
-            for uid, scripts in data.items():
-                if script_id in scripts:
-                    if script_id in running_scripts:
-                        process = running_scripts[script_id]
-                        try:
-                            parent = psutil.Process(process.pid)
-                            for child in parent.children(recursive=True):
-                                child.kill()
-                            parent.kill()
-                        except psutil.NoSuchProcess:
-                            pass
-                        del running_scripts[script_id]
-                    scripts[script_id]["status"] = "stopped"
-                    scripts[script_id]["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    save_data(data)
-                    
-                    markup = types.InlineKeyboardMarkup()
-                    restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
-                    markup.add(restart_btn)
-                    
-                    bot.edit_message_text(chat_id=call.message.chat.id,
-                                        message_id=call.message.message_id,
-                                        text=f"👑 *Admin Stopped Script*\n\n"
-                                             f"🆔 *ID:* `{script_id}`\n"
-                                             f"📂 *File:* `{scripts[script_id]['file_name']}`",
-                                        reply_markup=markup,
-                                        parse_mode="Markdown")
-                    bot.answer_callback_query(call.id, "Script stopped")
-                    return
-        elif user_id in data and script_id in data[user_id]:
-            if script_id in running_scripts:
-                process = running_scripts[script_id]
-                try:
-                    parent = psutil.Process(process.pid)
-                    for child in parent.children(recursive=True):
-                        child.kill()
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-                del running_scripts[script_id]
-            data[user_id][script_id]["status"] = "stopped"
-            data[user_id][script_id]["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            save_data(data)
-            
-            markup = types.InlineKeyboardMarkup()
-            restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
-            markup.add(restart_btn)
-            
-            bot.edit_message_text(chat_id=call.message.chat.id,
-                                message_id=call.message.message_id,
-                                text=f"🛑 *Script Stopped*\n\n"
-                                     f"🆔 *ID:* `{script_id}`\n"
-                                     f"📂 *File:* `{data[user_id][script_id]['file_name']}`",
-                                reply_markup=markup,
-                                parse_mode="Markdown")
-            bot.answer_callback_query(call.id, "Script stopped")
-        else:
-            bot.answer_callback_query(call.id, "Script not found")
+        record = find_script(user_id, script_id, admin)
+        if not record:
+            outbox.answer_callback_query(call.id, "Script not found")
+            return
+        
+        stop_script(script_id)
+        
+        markup = types.InlineKeyboardMarkup()
+        restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
+        markup.add(restart_btn)
+        
+        title = "👑 *Admin Stopped Script*" if admin else "🛑 *Script Stopped*"
+        outbox.edit_message_text(chat_id=call.message.chat.id,
+                            message_id=call.message.message_id,
+                            text=f"{title}\n\n"
+                                 f"🆔 *ID:* `{script_id}`\n"
+                                 f"📂 *File:* `{record.file_name}`",
+                            reply_markup=markup,
+                            parse_mode="Markdown")
+        outbox.answer_callback_query(call.id, "Script stopped")
+    
+    elif call.data.startswith("page_"):
+        view, page, user_filter, status_filter = parse_page_data(call.data)
+        rendered = render_view(view, call.message.chat.id, page, user_filter, status_filter)
+        if rendered is None:
+            outbox.answer_callback_query(call.id, "Admin only")
+            return
+        text, markup = rendered
+        outbox.edit_message_text(chat_id=call.message.chat.id,
+                            message_id=call.message.message_id,
+                            text=text,
+                            reply_markup=markup,
+                            parse_mode="Markdown")
+        outbox.answer_callback_query(call.id)
+    
+    elif call.data == "noop":
+        outbox.answer_callback_query(call.id)
     
     elif call.data.startswith("restart_"):
         script_id = call.data.split("_")[1]
         
-        if is_admin(call.message.chat.id):
-            for uid, scripts in data.items():
-                if script_id in scripts:
-                    script_data = scripts[script_id]
-                    if script_id in running_scripts:
-                        process = running_scripts[script_id]
-                        try:
-                            parent = psutil.Process(process.pid)
-                            for child in parent.children(recursive=True):
-                                child.kill()
-                            parent.kill()
-                        except psutil.NoSuchProcess:
-                            pass
-                        del running_scripts[script_id]
-                    
-                    script_path = script_data["script_path"]
-                    run_script(uid, script_id, script_path)
-                    
-                    markup = types.InlineKeyboardMarkup(row_width=2)
-                    stop_btn = types.InlineKeyboardButton("🛑 Stop", callback_data=f"stop_{script_id}")
-                    restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
-                    markup.add(stop_btn, restart_btn)
-                    
-                    bot.edit_message_text(chat_id=call.message.chat.id,
-                                        message_id=call.message.message_id,
-                                        text=f"👑 *Admin Restarted Script*\n\n"
-                                             f"🆔 *ID:* `{script_id}`\n"
-                                             f"📂 *File:* `{script_data['file_name']}`\n"
-                                             f"🔄 *Status:* 🟢 Running",
-                                        reply_markup=markup,
-                                        parse_mode="Markdown")
-                    bot.answer_callback_query(call.id, "Script restarted")
-                    return
-        elif user_id in data and script_id in data[user_id]:
-            script_data = data[user_id][script_id]
-            if script_id in running_scripts:
-                process = running_scripts[script_id]
-                try:
-                    parent = psutil.Process(process.pid)
-                    for child in parent.children(recursive=True):
-                        child.kill()
-                    parent.kill()
-                except psutil.NoSuchProcess:
-                    pass
-                del running_scripts[script_id]
-            
-            script_path = script_data["script_path"]
-            run_script(user_id, script_id, script_path)
-            
-            markup = types.InlineKeyboardMarkup(row_width=2)
-            stop_btn = types.InlineKeyboardButton("🛑 Stop", callback_data=f"stop_{script_id}")
-            restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
-            markup.add(stop_btn, restart_btn)
-            
-            bot.edit_message_text(chat_id=call.message.chat.id,
-                                message_id=call.message.message_id,
-                                text=f"🔄 *Script Restarted*\n\n"
-                                     f"🆔 *ID:* `{script_id}`\n"
-                                     f"📂 *File:* `{script_data['file_name']}`\n"
-                                     f"🔄 *Status:* 🟢 Running",
-                                reply_markup=markup,
-                                parse_mode="Markdown")
-            bot.answer_callback_query(call.id, "Script restarted")
-        else:
-            bot.answer_callback_query(call.id, "Script not found")
+        record = find_script(user_id, script_id, admin)
+        if not record:
+            outbox.answer_callback_query(call.id, "Script not found")
+            return
+        
+        if not restart_script(record):
+            outbox.answer_callback_query(call.id, not_started_message(record.user_id, script_id))
+            return
+        
+        markup = types.InlineKeyboardMarkup(row_width=2)
+        stop_btn = types.InlineKeyboardButton("🛑 Stop", callback_data=f"stop_{script_id}")
+        restart_btn = types.InlineKeyboardButton("🔄 Restart", callback_data=f"restart_{script_id}")
+        markup.add(stop_btn, restart_btn)
+        
+        title = "👑 *Admin Restarted Script*" if admin else "🔄 *Script Restarted*"
+        outbox.edit_message_text(chat_id=call.message.chat.id,
+                            message_id=call.message.message_id,
+                            text=f"{title}\n\n"
+                                 f"🆔 *ID:* `{script_id}`\n"
+                                 f"📂 *File:* `{record.file_name}`\n"
+                                 f"🔄 *Status:* 🟢 Running",
+                            reply_markup=markup,
+                            parse_mode="Markdown")
+        outbox.answer_callback_query(call.id, "Script restarted")
 
 # Health check endpoint
 @app.route('/')
@@ -480,18 +1007,118 @@ def health_check():
     return jsonify({
         "status": "running",
         "bot": "active",
+        "dispatcher": dispatcher.stats(),
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/healthz')
+def healthz():
+    checks = {
+        "supervisor": supervisor.thread is not None and supervisor.thread.is_alive(),
+        "scheduler": scheduler.thread is not None and scheduler.thread.is_alive(),
+        "outbox": bool(outbox.threads) and all(thread.is_alive() for thread in outbox.threads),
+    }
+    body = {"mode": "webhook" if webhook_active else "polling", "queue_depth": dispatcher.pending,
+            "outbox_pending": outbox.pending()}
+    if webhook_active:
+        body["last_update_age"] = time.monotonic() - last_webhook if last_webhook is not None else None
+    else:
+        # A live long-poll loop returns from getUpdates at least every polling timeout
+        last_poll = bot.last_poll or polling_started
+        body["last_poll_age"] = time.monotonic() - last_poll if last_poll is not None else None
+        checks["polling"] = (polling_thread is not None and polling_thread.is_alive()
+                             and body["last_poll_age"] < POLL_STALE_SECONDS)
+    healthy = all(checks.values())
+    body.update(status="ok" if healthy else "unhealthy", checks=checks)
+    return jsonify(body), 200 if healthy else 503
+
+def check_admin_token():
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ") or request.args.get("token")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token or "", ADMIN_TOKEN):
+        abort(403)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    check_admin_token()
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/logs/<script_id>')
+def script_log(script_id):
+    check_admin_token()
+    if script_id not in registry:
+        abort(404)
+    lines = request.args.get("n", "100")
+    lines = int(lines) if lines.isdigit() else 100
+    return Response((line + "\n" for line in script_logs.iter_tail(script_id, lines)),
+                    mimetype="text/plain")
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def webhook():
+    global last_webhook
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not webhook_active or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        abort(403)
+    update = types.Update.de_json(request.get_data(as_text=True))
+    if update is None:
+        abort(400)
+    last_webhook = time.monotonic()
+    # Never block the HTTP worker; Telegram redelivers on a non-2xx reply
+    if not bot.enqueue(update, block=False):
+        return "busy", 503
+    return ""
+
 # Start bot polling in background
 def run_bot():
-    cleanup_zombies()
+    bot.remove_webhook()
     print("🤖 Bot started polling...")
-    bot.infinity_polling(none_stop=True, restart_on_change=True)
+    bot.infinity_polling(none_stop=True)
+
+bootstrap_lock = threading.Lock()
+bootstrapped = False
+polling_thread = None
+polling_started = None
+webhook_active = False
+last_webhook = None
+
+def bootstrap():
+    # Runs once per process: from __main__, or from gunicorn's post_worker_init hook
+    global bootstrapped, polling_thread, polling_started, webhook_active
+    with bootstrap_lock:
+        if bootstrapped:
+            return
+        bootstrapped = True
+    
+    outbox.start()
+    supervisor.start()
+    sampler.start()
+    script_logs.start()
+    if forkserver is not None:
+        forkserver.start()
+    reconcile()
+    for record in registry.all():
+        if record.extra.get("schedule"):
+            scheduler.add(record.script_id, CronSchedule(record.extra["schedule"]))
+    scheduler.start()
+    for record in registry.with_status("building"):
+        # Builds interrupted by a restart start over; finished templates are reused
+        build_env(record.user_id, record.script_id, record.extra["requirements"])
+    
+    if WEBHOOK_URL:
+        try:
+            bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                            max_connections=HANDLER_WORKERS)
+            webhook_active = True
+            print(f"🤖 Bot receiving updates via webhook at {WEBHOOK_URL + WEBHOOK_PATH}")
+        except Exception as e:
+            # Without a registered webhook nothing would arrive at all
+            print(f"⚠️ Could not register webhook, falling back to polling: {e}")
+    if not webhook_active:
+        polling_started = time.monotonic()
+        polling_thread = threading.Thread(target=run_bot, name="polling", daemon=True)
+        polling_thread.start()
 
 if __name__ == '__main__':
     # For local development
     from waitress import serve
-    bot_thread = threading.Thread(target=run_bot, daemon=True)
-    bot_thread.start()
-    serve(app, host="0.0.0.0", port=5000)
\ No newline at end of file
+    bootstrap()
+    serve(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,62 @@
+# Compare hosted-script launch latency: fresh `python` via Popen vs the forkserver.
+# Usage: python benchmarks/launch_latency.py [runs] [modules]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from launcher import ForkServer
+
+
+def measure(launch, runs):
+    # Time from launch request until the script's first line of output
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        started = time.perf_counter()
+        process = launch(write_fd)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as output:
+            output.readline()
+            samples.append(time.perf_counter() - started)
+            process.wait()
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:<24} mean {statistics.mean(samples) * 1000:7.1f} ms   "
+          f"p50 {statistics.median(samples) * 1000:7.1f} ms   p99 {p99 * 1000:7.1f} ms")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    modules = sys.argv[2].split(",") if len(sys.argv) > 2 else ["json", "requests"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, "bench.py")
+        with open(script, "w") as f:
+            f.write("".join(f"import {module}\n" for module in modules))
+            f.write("print('ready', flush=True)\n")
+
+        report("popen", measure(lambda fd: subprocess.Popen(
+            [sys.executable, script], stdout=fd, stderr=subprocess.STDOUT), runs))
+
+        cold = ForkServer()
+        cold.start()
+        report("forkserver", measure(lambda fd: cold.launch(script, fd), runs))
+        cold.stop()
+
+        warm = ForkServer(modules)
+        warm.start()
+        report("forkserver+preload", measure(lambda fd: warm.launch(script, fd), runs))
+        warm.stop()
+
+
+if __name__ == '__main__':
+    main()
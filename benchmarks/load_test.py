@@ -0,0 +1,292 @@
+# Drive the real bot handlers with synthetic updates against a local fake Bot API server.
+# Usage: python benchmarks/load_test.py [--users N] [--scripts N] [--json out.json] [--baseline old.json]
+# Runs offline; everything (state db, scripts, logs) lives in a temporary directory.
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = "123456:bench"
+ADMIN = 1
+SCRIPT = b"import sys\nprint('hello from', sys.argv[0])\n"
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    # Just enough of the Bot API for the handlers: every call succeeds immediately
+    protocol_version = "HTTP/1.1"
+    # One write per response and no Nagle, or keep-alive calls stall on delayed ACKs
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    message_ids = itertools.count(1000)
+    calls = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, content_type="application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if url.path.startswith("/file/"):
+            self._reply(SCRIPT, "application/octet-stream")
+            return
+        method = url.path.rsplit("/", 1)[-1]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        self._reply(json.dumps({"ok": True, "result": self._result(method, params)}).encode())
+
+    def _result(self, method, params):
+        chat_id = int(params.get("chat_id") or 0)
+        if method in ("sendMessage", "editMessageText"):
+            message_id = int(params.get("message_id") or next(self.message_ids))
+            return {"message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "private"}}
+        if method == "getFile":
+            return {"file_id": params.get("file_id"), "file_unique_id": params.get("file_id"),
+                    "file_size": len(SCRIPT), "file_path": f"documents/{params.get('file_id')}.py"}
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method == "getUpdates":
+            return []
+        return True
+
+
+def start_fake_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-telegram", daemon=True).start()
+    return server
+
+
+# Synthetic updates
+
+update_ids = itertools.count(1)
+
+
+def user(uid):
+    return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+
+def message(uid, text=None, document=None):
+    data = {"message_id": next(update_ids), "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+            "from": user(uid)}
+    if text is not None:
+        data["text"] = text
+        command = text.split()[0]
+        data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    if document is not None:
+        data["document"] = document
+    return {"update_id": next(update_ids), "message": data}
+
+
+def callback(uid, data):
+    return {"update_id": next(update_ids), "callback_query": {
+        "id": str(next(update_ids)), "from": user(uid), "chat_instance": "bench", "data": data,
+        "message": {"message_id": next(update_ids), "date": int(time.time()),
+                    "chat": {"id": uid, "type": "private"}, "text": "…"}}}
+
+
+def upload(uid, name):
+    file_id = f"f{next(update_ids)}"
+    return message(uid, document={"file_id": file_id, "file_unique_id": file_id, "file_name": name,
+                                  "file_size": len(SCRIPT)})
+
+
+def seed(users, scripts):
+    # users -> script records, a third of them "running" so the status views have work to do
+    data = {}
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    for n in range(scripts):
+        uid = str(10000 + n % users)
+        status = ("running", "stopped", "exited")[n % 3]
+        data.setdefault(uid, {})[f"s{n:07d}"] = {
+            "file_name": f"bot_{n % 50}.py", "script_path": "scripts/seed.py", "status": status,
+            "upload_time": now, "start_time": now, "pid": None, "restart_policy": "never",
+            "sha256": "0" * 64, "size": len(SCRIPT), "version": 1}
+    return data
+
+
+# Measurement
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def store_totals(app):
+    seconds = {op: counts[-1] for (op,), counts in app.store_seconds.values.items()}
+    nbytes = {op: value for (op,), value in app.store_bytes.values.items()}
+    return seconds, nbytes
+
+
+def run_scenario(app, name, updates):
+    from telebot import types
+    process = psutil.Process()
+    app.dispatcher.latencies.clear()
+    seconds_before, bytes_before = store_totals(app)
+    parsed = [types.Update.de_json(update) for update in updates]
+
+    started = time.perf_counter()
+    app.bot.process_new_updates(parsed)
+    while app.dispatcher.pending:
+        time.sleep(0.005)
+    handled = time.perf_counter() - started
+    app.outbox.join(timeout=60)
+    drained = time.perf_counter() - started
+
+    latencies = list(app.dispatcher.latencies)
+    seconds_after, bytes_after = store_totals(app)
+    result = {
+        "updates": len(updates),
+        "throughput": len(updates) / handled if handled else 0.0,
+        "outbox_drain_seconds": drained,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "store_seconds": sum(seconds_after.values()) - sum(seconds_before.values()),
+        "store_read_bytes": bytes_after.get("load", 0) - bytes_before.get("load", 0),
+        "store_write_bytes": bytes_after.get("save", 0) - bytes_before.get("save", 0),
+        "rss_mb": process.memory_info().rss / 1024 / 1024,
+    }
+    print(f"{name:<16} {len(updates):6d} upd  {result['throughput']:8.0f} upd/s  "
+          f"p50 {result['latency_p50_ms']:7.2f} ms  p99 {result['latency_p99_ms']:7.2f} ms  "
+          f"store {result['store_seconds'] * 1000:7.1f} ms  "
+          f"r/w {result['store_read_bytes'] / 1024:7.0f}/{result['store_write_bytes'] / 1024:6.0f} KB  "
+          f"rss {result['rss_mb']:6.1f} MB")
+    return result
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--scripts", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000, help="updates per read-heavy scenario")
+    parser.add_argument("--uploads", type=int, default=200, help="uploads; each one spawns a real process")
+    parser.add_argument("--backend", default="sqlite", choices=("sqlite", "json"))
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if p99 or store time regress against this results file")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="allowed slowdown factor vs baseline")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(workdir)
+    os.environ.update(
+        TELEGRAM_TOKEN=TOKEN, ADMINS=str(ADMIN), STATE_BACKEND=args.backend,
+        STATE_DB=os.path.join(workdir, "state.db"), LOG_DIR=os.path.join(workdir, "logs"),
+        ENV_DIR=os.path.join(workdir, "envs"), SAMPLE_INTERVAL="3600",
+        OUTBOX_GLOBAL_RATE="1000000", OUTBOX_CHAT_RATE="1000000", OUTBOX_CHAT_BURST="1000000")
+
+    server = start_fake_api()
+    from telebot import apihelper
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    apihelper.API_URL = base + "/bot{0}/{1}"
+    apihelper.FILE_URL = base + "/file/bot{0}/{1}"
+
+    import app
+    # Keep every latency, not just the last window
+    app.dispatcher.latencies = deque()
+    app.outbox.start()
+    app.supervisor.start()
+
+    data = seed(args.users, args.scripts)
+    results = {"save_data_ms": timed(app.save_data, data), "load_data_ms": timed(app.load_data)}
+    print(f"{args.scripts} scripts / {args.users} users ({args.backend}): "
+          f"save_data {results['save_data_ms']:.1f} ms, load_data {results['load_data_ms']:.1f} ms")
+
+    rng = random.Random(42)
+    users = [10000 + n for n in range(args.users)]
+    seeded = [(int(uid), script_id) for uid, scripts in data.items() for script_id in scripts]
+    scenarios = {
+        "status": [message(rng.choice(users), "/status") for _ in range(args.requests)],
+        "admin_views": [message(ADMIN, text) for text in
+                        ("/status", "/list", "/list running", "/users") * (args.requests // 40 or 1)]
+                       + [callback(ADMIN, f"page_list_{rng.randint(1, 50)}__") for _ in range(args.requests // 2)],
+        "uploads": [upload(rng.choice(users), f"bot_{n % 20}.py") for n in range(args.uploads)],
+    }
+    for name, updates in scenarios.items():
+        results[name] = run_scenario(app, name, updates)
+
+    # Button bursts against the scripts the uploads just started
+    uploaded = [(int(r.user_id), r.script_id) for r in app.registry.all() if r.script_id not in data.get(r.user_id, {})]
+    burst = []
+    for uid, script_id in rng.sample(uploaded, min(len(uploaded), args.uploads)):
+        burst += [callback(uid, f"stop_{script_id}"), callback(uid, f"restart_{script_id}")]
+    burst += [callback(uid, f"stop_{script_id}") for uid, script_id in rng.sample(seeded, min(len(seeded), args.requests))]
+    results["buttons"] = run_scenario(app, "buttons", burst)
+    results["killall"] = run_scenario(app, "killall", [message(ADMIN, "/killall")])
+    results["api_calls"] = dict(FakeTelegram.calls)
+
+    for script_id in list(app.supervisor.processes):
+        app.kill_process(script_id)
+    server.shutdown()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = check_regressions(baseline, results, args.tolerance)
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1 if failures else 0)
+
+
+def check_regressions(baseline, results, tolerance):
+    # Small absolute floors keep sub-millisecond noise from failing CI
+    failures = []
+    for key in ("save_data_ms", "load_data_ms"):
+        if key in baseline and results[key] > max(baseline[key] * tolerance, baseline[key] + 5):
+            failures.append(f"{key}: {results[key]:.1f} ms vs baseline {baseline[key]:.1f} ms")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not isinstance(result, dict) or not isinstance(old, dict) or "latency_p99_ms" not in old:
+            continue
+        for key, floor in (("latency_p99_ms", 5), ("store_seconds", 0.05)):
+            if result[key] > max(old[key] * tolerance, old[key] + floor):
+                failures.append(f"{name} {key}: {result[key]:.2f} vs baseline {old[key]:.2f}")
+    return failures
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+
+
+class Dispatcher:
+    def __init__(self, workers=8, max_pending=1000, history=1024):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handler")
+        # Blocks the producer once max_pending updates are waiting
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.lanes = {}
+        self.pending = 0
+        self.handled = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=history)
+        self.waits = deque(maxlen=history)
+
+    def submit(self, key, fn, *args, block=True):
+        if not self.slots.acquire(blocking=block):
+            return False
+        item = (fn, args, time.monotonic())
+        with self.lock:
+            self.pending += 1
+            lane = self.lanes.get(key)
+            if lane is not None:
+                # Lane already owned by a worker, keep per-key order
+                lane.append(item)
+                return True
+            self.lanes[key] = deque([item])
+        self.executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        # One item per turn, then requeue, so a busy chat can't monopolise a worker
+        with self.lock:
+            fn, args, enqueued = self.lanes[key].popleft()
+        started = time.monotonic()
+        try:
+            fn(*args)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Handler failed: {e}")
+        finished = time.monotonic()
+        with self.lock:
+            self.pending -= 1
+            self.handled += 1
+            self.waits.append(started - enqueued)
+            self.latencies.append(finished - started)
+            if self.lanes[key]:
+                resubmit = True
+            else:
+                del self.lanes[key]
+                resubmit = False
+        self.slots.release()
+        if resubmit:
+            self.executor.submit(self._drain, key)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            waits = sorted(self.waits)
+            return {
+                "queue_depth": self.pending,
+                "active_chats": len(self.lanes),
+                "handled": self.handled,
+                "errors": self.errors,
+                "latency_p50": percentile(latencies, 0.5),
+                "latency_p99": percentile(latencies, 0.99),
+                "wait_p50": percentile(waits, 0.5),
+                "wait_p99": percentile(waits, 0.99),
+            }
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def update_key(update):
+    # Updates from one chat run in order; different chats run in parallel
+    message = update.message or update.edited_message or update.channel_post
+    if message is not None:
+        return message.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    return update.update_id
+
+
+class DispatchingBot(telebot.TeleBot):
+    def __init__(self, token, dispatcher, **kwargs):
+        super().__init__(token, threaded=False, **kwargs)
+        self.dispatcher = dispatcher
+        self.last_poll = None
+
+    def get_updates(self, *args, **kwargs):
+        updates = super().get_updates(*args, **kwargs)
+        # Heartbeat for /healthz: a long poll returns at least every polling timeout
+        self.last_poll = time.monotonic()
+        return updates
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # The offset must advance here, before the handler runs on a worker
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.enqueue(update)
+
+    def enqueue(self, update, block=True):
+        return self.dispatcher.submit(update_key(update), super().process_new_updates, [update], block=block)
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EnvBuildError(Exception):
+    pass
+
+
+def parse_requirements(text):
+    # Plain requirement specifiers only: pip options could redirect indexes or read host files
+    requirements = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("-"):
+            raise EnvBuildError(f"Unsupported requirements option: {line.split()[0]}")
+        requirements.append(line)
+    return sorted(set(requirements), key=str.lower)
+
+
+def requirements_key(requirements, python=sys.executable):
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    digest = hashlib.sha256("\n".join([python, version] + requirements).encode())
+    return digest.hexdigest()[:16]
+
+
+class EnvBuilder:
+    def __init__(self, root, workers=1, timeout=600, python=sys.executable):
+        self.root = os.path.abspath(root)
+        self.wheels = os.path.join(self.root, "wheels")
+        self.templates = os.path.join(self.root, "templates")
+        self.users = os.path.join(self.root, "users")
+        self.timeout = timeout
+        self.python = python
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="envbuild")
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+        for path in (self.wheels, self.templates, self.users):
+            os.makedirs(path, exist_ok=True)
+
+    def env_python(self, env_path):
+        return os.path.join(env_path, "bin", "python")
+
+    def build(self, user_id, requirements_text, progress=None):
+        # Parse up front so bad input fails on the caller's thread
+        requirements = parse_requirements(requirements_text)
+        return self.executor.submit(self._build, user_id, requirements, progress or (lambda text: None))
+
+    def _lock(self, key):
+        with self.locks_guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def _build(self, user_id, requirements, progress):
+        key = requirements_key(requirements, self.python)
+        env_path = os.path.join(self.users, user_id, key)
+        if os.path.exists(os.path.join(env_path, ".ready")):
+            progress("♻️ Reusing your existing environment")
+            return env_path
+        template = self._template(key, requirements, progress)
+        with self._lock(f"{user_id}/{key}"):
+            if not os.path.exists(os.path.join(env_path, ".ready")):
+                progress("🔗 Linking environment…")
+                os.makedirs(os.path.dirname(env_path), exist_ok=True)
+                tmp_path = tempfile.mkdtemp(dir=os.path.dirname(env_path), prefix=".tmp-")
+                os.rmdir(tmp_path)
+                # Hardlinks share the template's files, so a per-user env costs almost no disk
+                shutil.copytree(template, tmp_path, symlinks=True, copy_function=os.link)
+                shutil.rmtree(env_path, ignore_errors=True)
+                os.replace(tmp_path, env_path)
+        return env_path
+
+    def _template(self, key, requirements, progress):
+        # One fully built environment per distinct dependency set, shared by all users
+        template = os.path.join(self.templates, key)
+        with self._lock(key):
+            if os.path.exists(os.path.join(template, ".ready")):
+                return template
+            tmp_path = tempfile.mkdtemp(dir=self.templates, prefix=".tmp-")
+            try:
+                requirements_file = os.path.join(tmp_path, "requirements.txt")
+                with open(requirements_file, "w") as f:
+                    f.write("\n".join(requirements) + "\n")
+                if requirements:
+                    progress(f"📦 Fetching wheels for {len(requirements)} packages…")
+                    self._run([self.python, "-m", "pip", "wheel", "--quiet", "--wheel-dir", self.wheels,
+                               "--find-links", self.wheels, "-r", requirements_file])
+                progress("🛠 Creating environment…")
+                env_dir = os.path.join(tmp_path, "env")
+                self._run([self.python, "-m", "venv", "--without-pip", env_dir])
+                if requirements:
+                    progress("📥 Installing packages from the wheel cache…")
+                    self._run([self.python, "-m", "pip", "--python", self.env_python(env_dir), "install",
+                               "--quiet", "--no-index", "--find-links", self.wheels, "-r", requirements_file])
+                open(os.path.join(env_dir, ".ready"), "w").close()
+                shutil.rmtree(template, ignore_errors=True)
+                os.replace(env_dir, template)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        return template
+
+    def _run(self, args):
+        try:
+            result = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise EnvBuildError(f"{args[2]} timed out after {self.timeout}s")
+        if result.returncode != 0:
+            output = result.stdout.decode("utf-8", "replace").strip().splitlines()
+            raise EnvBuildError(output[-1] if output else f"{args[2]} failed")
@@ -0,0 +1,4 @@
+# Gunicorn imports app:app but never runs its __main__ block, so start the bot here
+def post_worker_init(worker):
+    from app import bootstrap
+    bootstrap()
@@ -0,0 +1,201 @@
+import importlib
+import json
+import os
+import resource
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+
+# Client side, used by the bot
+
+class ForkedProcess:
+    # The subset of Popen the supervisor relies on
+    def __init__(self, pid, sock):
+        self.pid = pid
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None and self.sock is not None:
+            # The forkserver reports the exit status once it reaps the child
+            self.sock.settimeout(timeout)
+            line = self.reader.readline().strip()
+            if line:
+                self.returncode = int(line)
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+        return self.returncode
+
+
+class ForkServer:
+    def __init__(self, preload=()):
+        self.preload = [module for module in preload if module]
+        self.process = None
+        self.socket_path = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.process is not None and self.process.poll() is None:
+                return
+            self.socket_path = os.path.join(tempfile.mkdtemp(prefix="forkserver-"), "sock")
+            # stdin stays open for the server's lifetime; EOF tells it the bot is gone
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), self.socket_path, ",".join(self.preload)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            if self.process.stdout.readline().strip() != b"ready":
+                raise RuntimeError("forkserver failed to start")
+
+    def launch(self, script_path, output_fd, rlimits=(), nice=0, cgroup=None):
+        # output_fd becomes the child's stdout and stderr; the caller keeps ownership of it
+        self.start()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            request = {"script": script_path, "cwd": os.getcwd(),
+                       "rlimits": [[limit, list(value)] for limit, value in rlimits],
+                       "nice": nice, "cgroup": cgroup}
+            socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [output_fd])
+        except OSError:
+            sock.close()
+            raise
+        process = ForkedProcess(None, sock)
+        try:
+            process.pid = int(process.reader.readline())
+        except (OSError, ValueError):
+            # No pid means no child to supervise; don't leak the socket
+            process.reader.close()
+            sock.close()
+            raise
+        return process
+
+    def stop(self):
+        with self.lock:
+            if self.process is not None:
+                self.process.stdin.close()
+                self.process.wait()
+                self.process = None
+
+
+# Server side, run as `python launcher.py <socket> <modules>`
+
+def serve(socket_path, preload):
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"⚠️ forkserver could not preload {module}: {e}", file=sys.stderr)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_w, False)
+    signal.signal(signal.SIGCHLD, lambda *args: None)
+    signal.set_wakeup_fd(wakeup_w)
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "accept")
+    selector.register(wakeup_r, selectors.EVENT_READ, "reap")
+    selector.register(sys.stdin.fileno(), selectors.EVENT_READ, "alive")
+    children = {}
+
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+
+    while True:
+        for key, _ in selector.select():
+            if key.data == "alive":
+                if not os.read(sys.stdin.fileno(), 1):
+                    # Bot exited: stop serving, hosted scripts keep running
+                    os.unlink(socket_path)
+                    sys.exit(0)
+            elif key.data == "reap":
+                os.read(wakeup_r, 4096)
+                while True:
+                    try:
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    conn = children.pop(pid, None)
+                    if conn is not None:
+                        try:
+                            conn.sendall(f"{os.waitstatus_to_exitcode(status)}\n".encode())
+                        except OSError:
+                            pass
+                        conn.close()
+            else:
+                conn, _ = listener.accept()
+                try:
+                    data, fds, _, _ = socket.recv_fds(conn, 65536, 1)
+                    request = json.loads(data)
+                except (OSError, ValueError):
+                    conn.close()
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                pid = os.fork()
+                if pid == 0:
+                    # Child: drop everything server-side and hand the request back to main
+                    signal.set_wakeup_fd(-1)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    selector.close()
+                    listener.close()
+                    conn.close()
+                    for other in children.values():
+                        other.close()
+                    os.close(wakeup_r)
+                    os.close(wakeup_w)
+                    return request, fds[0]
+                os.close(fds[0])
+                children[pid] = conn
+                conn.sendall(f"{pid}\n".encode())
+
+
+def prepare_child(request, output_fd):
+    # Same setup a fresh `python script.py` under Popen would get, in its own session
+    os.setsid()
+    if request.get("cgroup"):
+        try:
+            with open(os.path.join(request["cgroup"], "cgroup.procs"), "w") as f:
+                f.write(str(os.getpid()))
+        except OSError:
+            pass
+    for limit, value in request.get("rlimits", ()):
+        resource.setrlimit(limit, tuple(value))
+    if request.get("nice"):
+        os.nice(request["nice"])
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(output_fd, 1)
+    os.dup2(output_fd, 2)
+    os.close(devnull)
+    os.close(output_fd)
+    os.chdir(request["cwd"])
+
+    if "random" in sys.modules:
+        # Forked children would otherwise share the server's PRNG state
+        sys.modules["random"].seed()
+    script = request["script"]
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+
+
+if __name__ == '__main__':
+    modules = [module for module in sys.argv[2].split(",") if module] if len(sys.argv) > 2 else []
+    request, output_fd = serve(sys.argv[1], modules)
+    prepare_child(request, output_fd)
+    import runpy
+    runpy.run_path(request["script"], run_name="__main__")
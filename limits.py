@@ -0,0 +1,132 @@
+import json
+import os
+import resource
+
+import psutil
+
+
+class Limits:
+    def __init__(self, memory_mb=0, cpu_seconds=0, max_procs=0, cpu_percent=0,
+                 nice=0, ionice=None, cgroup_parent=None):
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_procs = max_procs
+        self.cpu_percent = cpu_percent
+        self.nice = nice
+        self.ionice = ionice
+        self.cgroup_parent = cgroup_parent if cgroup_parent and cgroup_available(cgroup_parent) else None
+        if max_procs and not self.cgroup_parent:
+            print("⚠️ SCRIPT_MAX_PROCS needs a delegated CGROUP_PARENT, it is not enforced")
+
+    @classmethod
+    def from_env(cls):
+        ionice = os.getenv('SCRIPT_IONICE', '')
+        return cls(memory_mb=int(os.getenv('SCRIPT_MAX_MEMORY_MB', '0')),
+                   cpu_seconds=int(os.getenv('SCRIPT_MAX_CPU_SECONDS', '0')),
+                   max_procs=int(os.getenv('SCRIPT_MAX_PROCS', '0')),
+                   cpu_percent=int(os.getenv('SCRIPT_CPU_PERCENT', '0')),
+                   nice=int(os.getenv('SCRIPT_NICE', '0')),
+                   ionice=ionice if ionice in IONICE_CLASSES else None,
+                   cgroup_parent=os.getenv('CGROUP_PARENT'))
+
+    def rlimits(self):
+        # RLIMIT_NPROC is left out on purpose: it counts every process and thread of the
+        # bot's uid, not of one script, so SCRIPT_MAX_PROCS is only enforced via pids.max
+        limits = []
+        if self.memory_mb:
+            size = self.memory_mb * 1024 * 1024
+            limits.append((resource.RLIMIT_AS, (size, size)))
+        if self.cpu_seconds:
+            limits.append((resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 5)))
+        return limits
+
+    def cgroup(self, script_id):
+        # One cgroup v2 leaf per script under a delegated parent, if configured
+        if not self.cgroup_parent:
+            return None
+        path = os.path.join(self.cgroup_parent, f"script-{script_id}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            if self.memory_mb:
+                write_cgroup(path, "memory.max", self.memory_mb * 1024 * 1024)
+            if self.cpu_percent:
+                write_cgroup(path, "cpu.max", f"{self.cpu_percent * 1000} 100000")
+            if self.max_procs:
+                write_cgroup(path, "pids.max", self.max_procs)
+        except OSError:
+            return None
+        return path
+
+    def release(self, script_id):
+        if self.cgroup_parent:
+            try:
+                os.rmdir(os.path.join(self.cgroup_parent, f"script-{script_id}"))
+            except OSError:
+                pass
+
+    def command(self, args, cgroup=None):
+        # Wraps args in EXEC_SHIM so the limits are in place before the script's first instruction;
+        # a preexec_fn could do the same but isn't safe with the bot's threads around
+        rlimits = self.rlimits()
+        if not rlimits and not self.nice and not cgroup:
+            return list(args)
+        limits = {"rlimits": [[limit, list(value)] for limit, value in rlimits],
+                  "nice": self.nice, "cgroup": cgroup}
+        return [args[0], "-S", "-c", EXEC_SHIM, json.dumps(limits)] + list(args)
+
+    def apply_ionice(self, pid):
+        if self.ionice:
+            try:
+                psutil.Process(pid).ionice(IONICE_CLASSES[self.ionice])
+            except (psutil.Error, OSError):
+                pass
+
+
+# Runs as `python -S -c EXEC_SHIM <limits json> <args...>`: joins the cgroup and sets the
+# rlimits and nice from inside the child, then execs args, which keep the same pid
+EXEC_SHIM = """
+import json, os, resource, sys
+limits = json.loads(sys.argv[1])
+if limits["cgroup"]:
+    try:
+        with open(os.path.join(limits["cgroup"], "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    except OSError:
+        pass
+for limit, value in limits["rlimits"]:
+    resource.setrlimit(limit, tuple(value))
+if limits["nice"]:
+    os.nice(limits["nice"])
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+IONICE_CLASSES = {
+    "idle": getattr(psutil, "IOPRIO_CLASS_IDLE", 3),
+    "best-effort": getattr(psutil, "IOPRIO_CLASS_BE", 2),
+}
+
+
+def cgroup_available(parent):
+    # cgroup v2 only: the parent must be a writable cgroup directory
+    try:
+        os.makedirs(parent, exist_ok=True)
+    except OSError:
+        return False
+    if not os.path.exists(os.path.join(parent, "cgroup.controllers")):
+        return False
+    for controller in ("memory", "cpu", "pids"):
+        try:
+            with open(os.path.join(parent, "cgroup.subtree_control"), "w") as f:
+                f.write(f"+{controller}")
+        except OSError:
+            pass
+    return os.access(parent, os.W_OK)
+
+
+def write_cgroup(path, name, value):
+    try:
+        with open(os.path.join(path, name), "w") as f:
+            f.write(str(value))
+    except FileNotFoundError:
+        # Controller not enabled for this subtree
+        pass
@@ -0,0 +1,104 @@
+import os
+import shutil
+import threading
+import time
+
+
+class LogStore:
+    # Scripts write straight into their log file, so their output outlives the bot;
+    # the bot only rotates the files and reads them back
+    def __init__(self, directory, max_bytes=1024 * 1024, backups=3, interval=1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, script_id):
+        return os.path.join(self.directory, f"{script_id}.log")
+
+    def open(self, script_id):
+        # For the script's stdout/stderr; the caller closes its copy once the script has started
+        return os.open(self.path(script_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="log-rotate", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.rotate_all()
+            except OSError as e:
+                print(f"⚠️ Log rotation failed: {e}")
+            time.sleep(self.interval)
+
+    def rotate_all(self):
+        # Checked on a timer rather than per write, so a file can overshoot max_bytes until the
+        # next pass; one scandir is cheap enough to run every second
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".log") and entry.stat().st_size > self.max_bytes:
+                    self._rotate(entry.path)
+
+    def _rotate(self, path):
+        # Copy, then truncate in place: the script's O_APPEND descriptor keeps writing to
+        # the start of the same file, which a rename would lose
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if self.backups:
+            self._copy_tail(path, f"{path}.1")
+        os.truncate(path, 0)
+
+    def _copy_tail(self, source, target):
+        # Keeps only the newest max_bytes, from a line start, so a burst between checks
+        # can't multiply across the backups
+        with open(source, "rb") as src, open(target + ".tmp", "wb") as dst:
+            size = src.seek(0, os.SEEK_END)
+            if size > self.max_bytes:
+                src.seek(size - self.max_bytes - 1)
+                # Drop the partial line, unless the cut already sits right after a newline
+                if src.read(1) != b"\n":
+                    src.readline()
+            else:
+                src.seek(0)
+            shutil.copyfileobj(src, dst)
+        os.replace(target + ".tmp", target)
+
+    def tail(self, script_id, n):
+        return list(self.iter_tail(script_id, n))
+
+    def iter_tail(self, script_id, n):
+        # Last n lines across the current file and its backups, newest file read last
+        base = self.path(script_id)
+        paths = [base] + [f"{base}.{i}" for i in range(1, self.backups + 1)]
+        chunks = []
+        remaining = n
+        for path in paths:
+            if remaining <= 0 or not os.path.exists(path):
+                break
+            lines = tail_file(path, remaining)
+            chunks.append(lines)
+            remaining -= len(lines)
+        for lines in reversed(chunks):
+            yield from lines
+
+
+def tail_file(path, n, block_size=8192):
+    # Reads backwards from the end so large files are never loaded whole
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= n:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    return [line.decode("utf-8", "replace") for line in lines[-n:]] if n else []
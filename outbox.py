@@ -0,0 +1,244 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class TelebotTransport:
+    def __init__(self, bot):
+        self.bot = bot
+
+    def call(self, method, kwargs):
+        return getattr(self.bot, method)(**kwargs)
+
+
+class Job:
+    __slots__ = ("method", "kwargs", "key", "attempts", "on_sent")
+
+    def __init__(self, method, kwargs, key=None, on_sent=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.key = key
+        self.attempts = 0
+        self.on_sent = on_sent
+
+
+class ProgressMessage:
+    # One chat message edited in place; updates before the first send lands are held back
+    def __init__(self, outbox, chat_id, text, **kwargs):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.message_id = None
+        self.pending = None
+        self.lock = threading.Lock()
+        outbox.send_message(chat_id, text, on_sent=self._sent, **kwargs)
+
+    def _sent(self, message):
+        with self.lock:
+            self.message_id = message.message_id
+            text, self.pending = self.pending, None
+        if text is not None:
+            self.update(text)
+
+    def update(self, text):
+        with self.lock:
+            if self.message_id is None:
+                self.pending = text
+                return
+        self.outbox.edit_message_text(text, self.chat_id, self.message_id, **self.kwargs)
+
+
+class Outbox:
+    def __init__(self, transport, global_rate=30.0, chat_rate=1.0, chat_burst=3, max_retries=5, workers=4):
+        self.transport = transport
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.workers = workers
+        # One FIFO lane per chat, sent one at a time; the heap picks the next ready lane
+        self.lanes = {}
+        self.busy = set()
+        self.buckets = {}
+        self.edits = {}
+        self.heap = []
+        self.scheduled = set()
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.inflight = 0
+        self.threads = []
+        self.stats = {"sent": 0, "coalesced": 0, "retried": 0, "dropped": 0}
+
+    def start(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f"outbox-{len(self.threads)}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # Same call shapes as the TeleBot methods handlers already use
+    def send_message(self, chat_id, text, on_sent=None, **kwargs):
+        self.submit(chat_id, Job("send_message", dict(kwargs, chat_id=chat_id, text=text), on_sent=on_sent))
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        kwargs = dict(kwargs, text=text, chat_id=chat_id, message_id=message_id)
+        key = (chat_id, message_id) if message_id is not None else None
+        self.submit(chat_id, Job("edit_message_text", kwargs, key=key))
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        # Callback answers don't count against per-chat limits and aren't ordered: the None
+        # lane hands them to as many workers as the global bucket allows
+        kwargs = dict(kwargs, callback_query_id=callback_query_id, text=text)
+        self.submit(None, Job("answer_callback_query", kwargs))
+
+    def submit(self, chat_id, job):
+        with self.cond:
+            if job.key is not None:
+                queued = self.edits.get(job.key)
+                if queued is not None:
+                    # Only the latest text of a still-queued edit is worth sending
+                    queued.kwargs = job.kwargs
+                    self.stats["coalesced"] += 1
+                    return
+                self.edits[job.key] = job
+            self.lanes.setdefault(chat_id, deque()).append(job)
+            if chat_id not in self.busy:
+                self._schedule(chat_id, time.monotonic())
+            self.cond.notify()
+
+    def pending(self):
+        with self.cond:
+            return sum(len(lane) for lane in self.lanes.values()) + self.inflight
+
+    def join(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.cond:
+            while self.lanes or self.inflight:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def _schedule(self, chat_id, when):
+        if chat_id not in self.scheduled:
+            self.scheduled.add(chat_id)
+            heapq.heappush(self.heap, (when, next(self.seq), chat_id))
+
+    def _bucket(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            if chat_id is None:
+                return self.global_bucket
+            bucket = self.buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_job(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                when, _, chat_id = self.heap[0]
+                if when > now:
+                    self.cond.wait(when - now)
+                    continue
+                heapq.heappop(self.heap)
+                self.scheduled.discard(chat_id)
+                lane = self.lanes.get(chat_id)
+                if not lane:
+                    self.lanes.pop(chat_id, None)
+                    continue
+                bucket = self._bucket(chat_id)
+                wait = max(self.global_bucket.wait_time(now), bucket.wait_time(now))
+                if wait > 0:
+                    self._schedule(chat_id, now + wait)
+                    continue
+                self.global_bucket.take()
+                if bucket is not self.global_bucket:
+                    bucket.take()
+                job = lane.popleft()
+                if not lane:
+                    del self.lanes[chat_id]
+                if job.key is not None:
+                    self.edits.pop(job.key, None)
+                if chat_id is not None:
+                    self.busy.add(chat_id)
+                elif lane:
+                    # Nothing to keep in order, so the next answer needn't wait for this one
+                    self._schedule(chat_id, now)
+                self.inflight += 1
+                return chat_id, job
+
+    def _run(self):
+        while True:
+            chat_id, job = self._next_job()
+            retry_at = result = None
+            try:
+                result = self.transport.call(job.method, job.kwargs)
+                self.stats["sent"] += 1
+            except Exception as e:
+                retry_at = self._retry_time(job, e)
+            if result is not None and job.on_sent is not None:
+                try:
+                    job.on_sent(result)
+                except Exception as e:
+                    print(f"⚠️ on_sent callback for {job.method} failed: {e}")
+            with self.cond:
+                self.inflight -= 1
+                self.busy.discard(chat_id)
+                if retry_at is not None and chat_id is None:
+                    self.stats["retried"] += 1
+                    # Blocking the global bucket would stall every chat; answers go stale
+                    # within seconds anyway, so this just rejoins the unordered lane
+                    self.lanes.setdefault(chat_id, deque()).append(job)
+                    self._schedule(chat_id, retry_at)
+                elif retry_at is not None:
+                    self.stats["retried"] += 1
+                    # Retry at the head of its lane so ordering within the chat holds
+                    self.lanes.setdefault(chat_id, deque()).appendleft(job)
+                    self._bucket(chat_id).block(retry_at)
+                    self._schedule(chat_id, retry_at)
+                elif chat_id in self.lanes:
+                    self._schedule(chat_id, time.monotonic())
+                self.cond.notify_all()
+
+    def _retry_time(self, job, error):
+        job.attempts += 1
+        code = getattr(error, "error_code", None)
+        if code == 429:
+            parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+            return time.monotonic() + parameters.get("retry_after", 1)
+        if code is not None and code < 500 or job.attempts > self.max_retries:
+            # Bad requests (e.g. "message is not modified") won't succeed on retry
+            self.stats["dropped"] += 1
+            if "not modified" not in str(error):
+                print(f"⚠️ Dropped {job.method}: {error}")
+            return None
+        return time.monotonic() + min(30, 2 ** job.attempts)
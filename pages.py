@@ -0,0 +1,50 @@
+from telebot import types
+
+
+MESSAGE_LIMIT = 4096
+
+
+def paginate(items, page, per_page):
+    pages = max(1, -(-len(items) // per_page))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * per_page
+    return items[start:start + per_page], page, pages
+
+
+def page_data(view, page, user_filter=None, status_filter=None):
+    # Kept well under Telegram's 64-byte callback_data limit
+    return f"page_{view}_{page}_{user_filter or ''}_{status_filter or ''}"
+
+
+def parse_page_data(data):
+    _, view, page, user_filter, status_filter = data.split("_", 4)
+    return view, int(page), user_filter or None, status_filter or None
+
+
+def nav_markup(view, page, pages, user_filter=None, status_filter=None):
+    if pages <= 1:
+        return None
+    buttons = []
+    if page > 1:
+        buttons.append(types.InlineKeyboardButton(
+            "⬅️ Prev", callback_data=page_data(view, page - 1, user_filter, status_filter)))
+    buttons.append(types.InlineKeyboardButton(f"{page}/{pages}", callback_data="noop"))
+    if page < pages:
+        buttons.append(types.InlineKeyboardButton(
+            "Next ➡️", callback_data=page_data(view, page + 1, user_filter, status_filter)))
+    markup = types.InlineKeyboardMarkup(row_width=3)
+    markup.add(*buttons)
+    return markup
+
+
+def render(header, items, page, per_page, format_item):
+    # Only the visible slice is formatted
+    visible, page, pages = paginate(items, page, per_page)
+    parts = [header]
+    parts.extend(format_item(item) for item in visible)
+    if pages > 1:
+        parts.append(f"📄 Page {page}/{pages} · {len(items)} total")
+    text = "".join(parts)
+    if len(text) > MESSAGE_LIMIT:
+        text = text[:MESSAGE_LIMIT - 2] + "…"
+    return text, page, pages
@@ -0,0 +1,141 @@
+import threading
+from contextlib import contextmanager
+
+
+class ScriptRecord:
+    __slots__ = ("user_id", "script_id", "file_name", "script_path", "status",
+                 "upload_time", "pid", "start_time", "end_time", "extra")
+
+    FIELDS = ("file_name", "script_path", "status", "upload_time", "pid", "start_time", "end_time")
+
+    def __init__(self, user_id, script_id, file_name, script_path, status="pending",
+                 upload_time=None, pid=None, start_time=None, end_time=None, extra=None):
+        self.user_id = user_id
+        self.script_id = script_id
+        self.file_name = file_name
+        self.script_path = script_path
+        self.status = status
+        self.upload_time = upload_time
+        self.pid = pid
+        self.start_time = start_time
+        self.end_time = end_time
+        # Fields this version doesn't know about survive a round trip
+        self.extra = extra or {}
+
+    @classmethod
+    def from_dict(cls, user_id, script_id, data):
+        data = dict(data)
+        known = {field: data.pop(field) for field in cls.FIELDS if field in data}
+        return cls(user_id, script_id, extra=data, **known)
+
+    def to_dict(self):
+        data = dict(self.extra)
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+
+class Registry:
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.RLock()
+        self.pending = None
+        self.load()
+
+    def load(self):
+        with self.lock:
+            self.by_id = {}
+            self.by_user = {}
+            self.by_status = {}
+            for user_id, script_id, data in self.store.scripts():
+                self._index(ScriptRecord.from_dict(user_id, script_id, data))
+
+    def _index(self, record):
+        self.by_id[record.script_id] = record
+        self.by_user.setdefault(record.user_id, {})[record.script_id] = record
+        self.by_status.setdefault(record.status, {})[record.script_id] = record
+
+    def _unindex(self, record):
+        self.by_id.pop(record.script_id, None)
+        self.by_user.get(record.user_id, {}).pop(record.script_id, None)
+        self.by_status.get(record.status, {}).pop(record.script_id, None)
+
+    def __contains__(self, script_id):
+        return script_id in self.by_id
+
+    def get(self, script_id):
+        return self.by_id.get(script_id)
+
+    def owner(self, script_id):
+        record = self.by_id.get(script_id)
+        return record.user_id if record else None
+
+    def for_user(self, user_id, status=None):
+        with self.lock:
+            records = self.by_user.get(user_id, {}).values()
+            return [r for r in records if status is None or r.status == status]
+
+    def with_status(self, *statuses):
+        with self.lock:
+            return [r for status in statuses for r in self.by_status.get(status, {}).values()]
+
+    def all(self):
+        with self.lock:
+            return list(self.by_id.values())
+
+    def users(self):
+        with self.lock:
+            return {
+                uid: (sum(1 for r in scripts.values() if r.status == "running"), len(scripts))
+                for uid, scripts in self.by_user.items() if scripts
+            }
+
+    def add(self, record):
+        with self.lock:
+            old = self.by_id.get(record.script_id)
+            if old is not None:
+                self._unindex(old)
+            self._index(record)
+            self.store.put(record.user_id, record.script_id, record.to_dict())
+        return record
+
+    def update(self, script_id, **fields):
+        with self.lock:
+            record = self.by_id.get(script_id)
+            if record is None:
+                return None
+            if "status" in fields and fields["status"] != record.status:
+                self.by_status.get(record.status, {}).pop(script_id, None)
+                self.by_status.setdefault(fields["status"], {})[script_id] = record
+            for field, value in fields.items():
+                if field in ScriptRecord.FIELDS:
+                    setattr(record, field, value)
+                else:
+                    record.extra[field] = value
+            if self.pending is not None:
+                self.pending[script_id] = record
+            else:
+                self.store.put(record.user_id, script_id, record.to_dict())
+            return record
+
+    @contextmanager
+    def batch(self):
+        # Updates inside the block apply in memory at once and reach the store in one write;
+        # other threads wait on the lock, so nobody sees a half-applied batch
+        with self.lock:
+            self.pending = {}
+            try:
+                yield
+            finally:
+                pending, self.pending = self.pending, None
+                if pending:
+                    self.store.put_many([(r.user_id, script_id, r.to_dict()) for script_id, r in pending.items()])
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                uid: {script_id: r.to_dict() for script_id, r in scripts.items()}
+                for uid, scripts in self.by_user.items() if scripts
+            }
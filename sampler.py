@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import namedtuple
+
+import psutil
+
+
+Sample = namedtuple("Sample", "timestamp cpu_percent rss threads procs")
+
+
+class Sampler:
+    def __init__(self, roots, interval=5.0):
+        # roots() returns {pid: script_id} for every hosted process to track
+        self.roots = roots
+        self.interval = interval
+        # script_id -> latest Sample
+        self.samples = {}
+        self.cpu_totals = {}
+        self.last_sample = None
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️ Sampler failed: {e}")
+            time.sleep(self.interval)
+
+    def sample(self):
+        roots = self.roots()
+        now = time.monotonic()
+        # One pass over the process table for every hosted tree
+        procs = {}
+        children = {}
+        for proc in psutil.process_iter(["pid", "ppid", "cpu_times", "memory_info", "num_threads"]):
+            info = proc.info
+            if info["cpu_times"] is None or info["memory_info"] is None:
+                continue
+            procs[info["pid"]] = info
+            children.setdefault(info["ppid"], []).append(info["pid"])
+
+        elapsed = now - self.last_sample if self.last_sample else None
+        cpu_totals = {}
+        samples = {}
+        for root, script_id in roots.items():
+            if root not in procs:
+                continue
+            cpu = rss = threads = count = 0
+            stack = [root]
+            while stack:
+                pid = stack.pop()
+                info = procs.get(pid)
+                if info is None:
+                    continue
+                cpu += info["cpu_times"].user + info["cpu_times"].system
+                rss += info["memory_info"].rss
+                threads += info["num_threads"] or 0
+                count += 1
+                stack.extend(children.get(pid, ()))
+            cpu_totals[script_id] = (root, cpu)
+            previous = self.cpu_totals.get(script_id)
+            cpu_percent = 0.0
+            if elapsed and previous and previous[0] == root:
+                cpu_percent = max(0.0, (cpu - previous[1]) / elapsed * 100)
+            samples[script_id] = Sample(time.time(), cpu_percent, rss, threads, count)
+
+        # Swapped in whole so readers never see a half-built pass
+        self.samples = samples
+        self.cpu_totals = cpu_totals
+        self.last_sample = now
+
+    def latest(self, script_id):
+        return self.samples.get(script_id)
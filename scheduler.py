@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+OVERLAP_POLICIES = ("skip", "queue", "replace")
+
+MACROS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+
+
+def parse_field(spec, low, high):
+    values = set()
+    for part in spec.split(","):
+        value_range, slash, step = part.partition("/")
+        try:
+            step = int(step) if slash else 1
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-", 1))
+            else:
+                start = int(value_range)
+                # "5/15" means every 15 starting at 5
+                end = high if slash else start
+        except ValueError:
+            raise ValueError(f"Invalid cron field: {spec}")
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Invalid cron field: {spec}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    # Standard 5-field cron (minute hour day-of-month month day-of-week), in server local time
+    def __init__(self, expression):
+        fields = MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError("A cron expression needs 5 fields: minute hour day month weekday")
+        self.expression = " ".join(fields)
+        self.minutes = parse_field(fields[0], 0, 59)
+        self.hours = parse_field(fields[1], 0, 23)
+        self.days = parse_field(fields[2], 1, 31)
+        self.months = parse_field(fields[3], 1, 12)
+        # 0 and 7 are both Sunday
+        self.weekdays = {day % 7 for day in parse_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, when):
+        day = when.day in self.days
+        weekday = (when.weekday() + 1) % 7 in self.weekdays
+        if not self.any_day and not self.any_weekday:
+            # Like cron: when both are restricted, either one matching is enough
+            return day or weekday
+        return day and weekday
+
+    def next_after(self, after):
+        # Skips whole months, days and hours that can't match, so this takes at most a few hundred steps
+        when = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = when + timedelta(days=5 * 366)
+        while when < limit:
+            if when.month not in self.months:
+                when = (when.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(when):
+                when = when.replace(hour=0, minute=0) + timedelta(days=1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute=0) + timedelta(hours=1)
+            elif when.minute not in self.minutes:
+                when += timedelta(minutes=1)
+            else:
+                return when
+        return None
+
+
+class Scheduler:
+    def __init__(self, on_due):
+        self.on_due = on_due
+        # script_id -> (schedule, next_run, seq); heap entries whose seq no longer matches are stale
+        self.jobs = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self.thread.start()
+
+    def add(self, script_id, schedule):
+        with self.cond:
+            next_run = self._push(script_id, schedule, datetime.now())
+            self.cond.notify()
+        return next_run
+
+    def remove(self, script_id):
+        with self.cond:
+            return self.jobs.pop(script_id, None) is not None
+
+    def next_run(self, script_id):
+        job = self.jobs.get(script_id)
+        return job[1] if job else None
+
+    def _push(self, script_id, schedule, after):
+        next_run = schedule.next_after(after)
+        seq = next(self.seq)
+        self.jobs[script_id] = (schedule, next_run, seq)
+        if next_run is not None:
+            heapq.heappush(self.heap, (next_run.timestamp(), seq, script_id))
+        return next_run
+
+    def _next_due(self):
+        with self.cond:
+            while True:
+                while self.heap and self.jobs.get(self.heap[0][2], (None, None, None))[2] != self.heap[0][1]:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                delay = self.heap[0][0] - time.time()
+                if delay > 0:
+                    # Wake at least once a minute so wall-clock jumps are noticed
+                    self.cond.wait(min(delay, 60))
+                    continue
+                _, _, script_id = heapq.heappop(self.heap)
+                schedule = self.jobs[script_id][0]
+                self._push(script_id, schedule, datetime.now())
+                return script_id
+
+    def _run(self):
+        while True:
+            script_id = self._next_due()
+            try:
+                self.on_due(script_id)
+            except Exception as e:
+                print(f"⚠️ Scheduled run of {script_id} failed: {e}")
@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StoreHooks:
+    # Optional instrumentation: on_io(op, seconds, nbytes) and on_lock_wait(seconds)
+    on_io = None
+    on_lock_wait = None
+
+    @contextmanager
+    def _locked(self, lock):
+        started = time.perf_counter()
+        with lock:
+            if self.on_lock_wait is not None:
+                self.on_lock_wait(time.perf_counter() - started)
+            yield
+
+    def _observe(self, op, started, nbytes):
+        if self.on_io is not None:
+            self.on_io(op, time.perf_counter() - started, nbytes)
+
+
+# JSON backend: the original whole-file layout, kept for small installs
+class JsonStore(StoreHooks):
+    SETTINGS_KEY = "_settings"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.settings = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = json.load(f)
+            self.settings = self.data.pop(self.SETTINGS_KEY, {})
+        else:
+            self.data = {}
+            self._flush()
+
+    def _flush(self):
+        started = time.perf_counter()
+        tmp_path = self.path + ".tmp"
+        data = dict(self.data, **{self.SETTINGS_KEY: self.settings}) if self.settings else self.data
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=4)
+            size = f.tell()
+        os.replace(tmp_path, self.path)
+        self._observe("save", started, size)
+
+    def get_setting(self, key, default=None):
+        with self._locked(self.lock):
+            return self.settings.get(key, default)
+
+    def set_setting(self, key, value):
+        with self._locked(self.lock):
+            if value is None:
+                self.settings.pop(key, None)
+            else:
+                self.settings[key] = value
+            self._flush()
+
+    def put(self, user_id, script_id, record):
+        with self._locked(self.lock):
+            self.data.setdefault(user_id, {})[script_id] = dict(record)
+            self._flush()
+
+    def put_many(self, rows):
+        with self._locked(self.lock):
+            for user_id, script_id, record in rows:
+                self.data.setdefault(user_id, {})[script_id] = dict(record)
+            self._flush()
+
+    def scripts(self, user_id=None, status=None):
+        with self._locked(self.lock):
+            users = [user_id] if user_id is not None else list(self.data)
+            result = []
+            for uid in users:
+                for script_id, record in self.data.get(uid, {}).items():
+                    if status is None or record["status"] == status:
+                        result.append((uid, script_id, dict(record)))
+            return result
+
+    def replace_all(self, data):
+        with self._locked(self.lock):
+            self.data = json.loads(json.dumps(data))
+            self._flush()
+
+    def is_empty(self):
+        with self._locked(self.lock):
+            return not self.data
+
+
+# SQLite backend: one row per (user_id, script_id), status indexed
+class SqliteStore(StoreHooks):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scripts (
+            user_id TEXT NOT NULL,
+            script_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, script_id)
+        );
+        CREATE INDEX IF NOT EXISTS scripts_status ON scripts (status);
+        -- Nothing looks scripts up by id alone any more; older databases still have this index
+        DROP INDEX IF EXISTS scripts_script_id;
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def put(self, user_id, script_id, record):
+        started = time.perf_counter()
+        data = json.dumps(record)
+        with self._locked(self.write_lock):
+            self._conn().execute(
+                "INSERT OR REPLACE INTO scripts (user_id, script_id, status, data) VALUES (?, ?, ?, ?)",
+                (user_id, script_id, record["status"], data))
+        self._observe("save", started, len(data))
+
+    def put_many(self, rows):
+        started = time.perf_counter()
+        rows = [(user_id, script_id, record["status"], json.dumps(record)) for user_id, script_id, record in rows]
+        with self._locked(self.write_lock):
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO scripts (user_id, script_id, status, data) VALUES (?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._observe("save", started, sum(len(row[3]) for row in rows))
+
+    def scripts(self, user_id=None, status=None):
+        query = "SELECT user_id, script_id, data FROM scripts"
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        started = time.perf_counter()
+        rows = self._conn().execute(query, params).fetchall()
+        self._observe("load", started, sum(len(row[2]) for row in rows))
+        return [(uid, script_id, json.loads(data)) for uid, script_id, data in rows]
+
+    def replace_all(self, data):
+        started = time.perf_counter()
+        with self._locked(self.write_lock):
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM scripts")
+                size = self._insert_many(conn, data)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._observe("save", started, size)
+
+    def import_data(self, data):
+        started = time.perf_counter()
+        with self._locked(self.write_lock):
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                size = self._insert_many(conn, data)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._observe("save", started, size)
+
+    def _insert_many(self, conn, data):
+        rows = [(uid, script_id, record.get("status", "stopped"), json.dumps(record))
+                for uid, scripts in data.items()
+                for script_id, record in scripts.items()]
+        conn.executemany(
+            "INSERT OR REPLACE INTO scripts (user_id, script_id, status, data) VALUES (?, ?, ?, ?)", rows)
+        return sum(len(row[3]) for row in rows)
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM scripts LIMIT 1").fetchone() is None
+
+    def get_setting(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key, value):
+        with self._locked(self.write_lock):
+            if value is None:
+                self._conn().execute("DELETE FROM settings WHERE key = ?", (key,))
+            else:
+                self._conn().execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                     (key, json.dumps(value)))
+
+
+def migrate_json(json_path, store):
+    # One-time import of a legacy user_data.json into a fresh store
+    if not os.path.exists(json_path) or not store.is_empty():
+        return 0
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    settings = data.pop(JsonStore.SETTINGS_KEY, {})
+    store.import_data(data)
+    for key, value in settings.items():
+        store.set_setting(key, value)
+    os.replace(json_path, json_path + ".migrated")
+    return sum(len(scripts) for scripts in data.values())
+
+
+def open_store(backend, path):
+    if backend == "json":
+        return JsonStore(path)
+    if backend == "sqlite":
+        return SqliteStore(path)
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+import psutil
+
+
+RESTART_POLICIES = ("never", "on-failure", "always")
+
+
+class RestartTracker:
+    def __init__(self, base=1.0, cap=300.0, burst=5, window=60.0):
+        self.base = base
+        self.cap = cap
+        self.burst = burst
+        self.window = window
+        # Consecutive short runs since the last healthy one: the backoff exponent
+        self.failures = {}
+        # Uptimes of the last `burst` of those runs, for the crash-loop breaker
+        self.uptimes = {}
+
+    def should_restart(self, policy, returncode):
+        if policy == "always":
+            return True
+        # None means the exit status is unknown (an adopted script), not that it failed
+        return policy == "on-failure" and returncode not in (0, None)
+
+    def next_delay(self, script_id, uptime):
+        # Returns None once the script is crash-looping
+        if uptime >= self.window:
+            # Only a run that stayed up for the whole window clears the backoff
+            self.reset(script_id)
+        failures = self.failures[script_id] = self.failures.get(script_id, 0) + 1
+        uptimes = self.uptimes.setdefault(script_id, deque(maxlen=self.burst))
+        uptimes.append(uptime)
+        # Counted in uptime rather than wall-clock, so the growing delays between
+        # restarts can't age failures out before the breaker sees them
+        if len(uptimes) == self.burst and sum(uptimes) < self.window:
+            return None
+        return min(self.cap, self.base * 2 ** min(failures - 1, 32))
+
+    def reset(self, script_id):
+        self.failures.pop(script_id, None)
+        self.uptimes.pop(script_id, None)
+
+
+def find_processes(expected):
+    # expected maps pid -> (create_time, cmdline, script_path); one /proc listing, then only those pids
+    live = set(psutil.pids())
+    found = {}
+    for pid, (create_time, cmdline, script_path) in expected.items():
+        if pid not in live:
+            continue
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                if process.status() == psutil.STATUS_ZOMBIE:
+                    continue
+                # A reused pid has a different start time or command line
+                if create_time is not None and abs(process.create_time() - create_time) > 1:
+                    continue
+                actual = process.cmdline()
+                if cmdline and actual != cmdline or not cmdline and script_path not in actual:
+                    continue
+                found[pid] = process.create_time()
+        except psutil.Error:
+            continue
+    return found
+
+
+def signal_group(pid, sig):
+    # Scripts lead their own session, so one killpg reaches every descendant
+    try:
+        pgid = os.getpgid(pid)
+        if pgid == pid and pgid != os.getpgrp():
+            os.killpg(pgid, sig)
+            return
+    except ProcessLookupError:
+        return
+    # Started before scripts got their own group: signal the tree one by one
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.send_signal(sig)
+        except psutil.NoSuchProcess:
+            pass
+
+
+class AdoptedProcess:
+    # A script left running by a previous bot process; not our child, so no exit code
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+        self.process = psutil.Process(pid)
+
+    def poll(self):
+        return None if self.process.is_running() else self.returncode
+
+    def wait(self, timeout=None):
+        try:
+            self.process.wait(timeout)
+        except psutil.NoSuchProcess:
+            pass
+        return self.returncode
+
+
+class Supervisor:
+    def __init__(self):
+        self.on_exit = None
+        self.processes = {}
+        self.started = {}
+        self.timers = {}
+        self.stopping = set()
+        self.lock = threading.Lock()
+        self.exited = threading.Condition(self.lock)
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop.run_forever, name="supervisor", daemon=True)
+            self.thread.start()
+
+    def spawn(self, script_id, args, **popen_kwargs):
+        process = subprocess.Popen(args, **popen_kwargs)
+        self.watch(script_id, process)
+        return process
+
+    def adopt(self, script_id, pid, create_time):
+        process = AdoptedProcess(pid)
+        self.watch(script_id, process, started=time.monotonic() - max(0.0, time.time() - create_time))
+        return process
+
+    def watch(self, script_id, process, started=None):
+        # Accepts a Popen or anything shaped like one (pid, wait)
+        with self.lock:
+            self.processes[script_id] = process
+            self.started[process.pid] = started if started is not None else time.monotonic()
+        self.loop.call_soon_threadsafe(self._watch, script_id, process)
+
+    def get(self, script_id):
+        return self.processes.get(script_id)
+
+    def call_later(self, script_id, delay, callback, *args):
+        def fire():
+            self.timers.pop(script_id, None)
+            callback(*args)
+        self.cancel(script_id)
+        self.timers[script_id] = self.loop.call_later(delay, fire)
+
+    def cancel(self, script_id):
+        timer = self.timers.pop(script_id, None)
+        if timer is not None:
+            self.loop.call_soon_threadsafe(timer.cancel)
+
+    def stop(self, script_id, timeout=5.0):
+        return self.stop_many([script_id], timeout).get(script_id)
+
+    def stop_many(self, script_ids, timeout=5.0):
+        # SIGTERM every group at once, wait on one shared deadline, then SIGKILL the rest.
+        # Returns {script_id: returncode} for the processes that were running.
+        for script_id in script_ids:
+            self.cancel(script_id)
+        with self.lock:
+            targets = {script_id: self.processes[script_id] for script_id in script_ids
+                       if script_id in self.processes}
+            self.stopping.update(process.pid for process in targets.values())
+        for process in targets.values():
+            signal_group(process.pid, signal.SIGTERM)
+        self._wait_exited(targets, timeout)
+        for script_id, process in targets.items():
+            if self.processes.get(script_id) is process:
+                signal_group(process.pid, signal.SIGKILL)
+            elif process.pid != os.getpgrp():
+                # Leader already reaped, but its group lives on while a grandchild remains
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    pass
+        self._wait_exited(targets, 1.0)
+        return {script_id: process.returncode for script_id, process in targets.items()}
+
+    def _wait_exited(self, targets, timeout):
+        if threading.current_thread() is self.thread:
+            # Reaping happens on this thread, waiting here would only stall it
+            return
+        with self.exited:
+            self.exited.wait_for(
+                lambda: all(self.processes.get(script_id) is not process for script_id, process in targets.items()),
+                timeout)
+
+    def _watch(self, script_id, process):
+        # pidfd becomes readable once the child exits, so no thread or poll per child
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except (AttributeError, OSError):
+            threading.Thread(target=self._wait, args=(script_id, process), daemon=True).start()
+            return
+        self.loop.add_reader(pidfd, self._on_pidfd, pidfd, script_id, process)
+
+    def _wait(self, script_id, process):
+        process.wait()
+        self.loop.call_soon_threadsafe(self._reap, script_id, process)
+
+    def _on_pidfd(self, pidfd, script_id, process):
+        self.loop.remove_reader(pidfd)
+        os.close(pidfd)
+        self._reap(script_id, process)
+
+    def _reap(self, script_id, process):
+        returncode = process.wait()
+        with self.lock:
+            if self.processes.get(script_id) is process:
+                del self.processes[script_id]
+            stopped = process.pid in self.stopping
+            self.stopping.discard(process.pid)
+            uptime = time.monotonic() - self.started.pop(process.pid, time.monotonic())
+            self.exited.notify_all()
+        if self.on_exit:
+            try:
+                self.on_exit(script_id, process, returncode, stopped, uptime)
+            except Exception as e:
+                print(f"⚠️ Exit handler failed for {script_id}: {e}")
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+
+from dispatch import Dispatcher
+
+
+def wait_idle(dispatcher, timeout=10):
+    deadline = time.monotonic() + timeout
+    while dispatcher.stats()["queue_depth"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return dispatcher.stats()["queue_depth"] == 0
+
+
+def test_per_key_order():
+    dispatcher = Dispatcher(workers=8)
+    seen = {}
+    lock = threading.Lock()
+
+    def handle(key, i):
+        time.sleep(random.random() / 1000)
+        with lock:
+            seen.setdefault(key, []).append(i)
+
+    for i in range(50):
+        for key in range(5):
+            dispatcher.submit(key, handle, key, i)
+    assert wait_idle(dispatcher)
+    assert seen == {key: list(range(50)) for key in range(5)}
+
+
+def test_one_handler_per_key_at_a_time():
+    dispatcher = Dispatcher(workers=8)
+    active = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def handle(key):
+        with lock:
+            active[key] = active.get(key, 0) + 1
+            if active[key] > 1:
+                overlaps.append(key)
+        time.sleep(0.001)
+        with lock:
+            active[key] -= 1
+
+    for _ in range(20):
+        for key in range(3):
+            dispatcher.submit(key, handle, key)
+    assert wait_idle(dispatcher)
+    assert overlaps == []
+
+
+def test_keys_run_in_parallel():
+    dispatcher = Dispatcher(workers=4)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def block():
+        started.release()
+        release.wait(5)
+
+    for key in range(4):
+        dispatcher.submit(key, block)
+    # All four keys get a worker even though none has finished
+    assert all(started.acquire(timeout=5) for _ in range(4))
+    release.set()
+    assert wait_idle(dispatcher)
+
+
+def test_failing_handler_does_not_stall_its_key():
+    dispatcher = Dispatcher(workers=2)
+    done = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    dispatcher.submit(1, fail)
+    dispatcher.submit(1, done.append, "after")
+    assert wait_idle(dispatcher)
+    assert done == ["after"]
+    assert dispatcher.stats()["errors"] == 1
+
+
+def test_non_blocking_submit_when_full():
+    dispatcher = Dispatcher(workers=1, max_pending=2)
+    release = threading.Event()
+    dispatcher.submit(1, release.wait, 5)
+    assert dispatcher.submit(1, lambda: None, block=False)
+    assert not dispatcher.submit(2, lambda: None, block=False)
+    release.set()
+    assert wait_idle(dispatcher)
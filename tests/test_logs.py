@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from logs import LogStore, tail_file
+
+
+def write_lines(store, script_id, lines):
+    fd = store.open(script_id)
+    try:
+        os.write(fd, "".join(f"{line}\n" for line in lines).encode())
+    finally:
+        os.close(fd)
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Each line is "line NN\n", 8 bytes, so a rotated file keeps up to 12 lines
+    return LogStore(str(tmp_path), max_bytes=100, backups=2)
+
+
+def test_tail_file_across_blocks(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1000)))
+    assert tail_file(str(path), 3, block_size=16) == ["line 997", "line 998", "line 999"]
+    assert tail_file(str(path), 0) == []
+
+
+def test_tail_file_without_trailing_newline(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_bytes(b"one\ntwo\nthree")
+    assert tail_file(str(path), 2, block_size=4) == ["two", "three"]
+    assert tail_file(str(path), 10) == ["one", "two", "three"]
+
+
+def test_tail_across_rotated_backups(store):
+    write_lines(store, "s", [f"line {i:02}" for i in range(13)])
+    store.rotate_all()
+    assert os.path.getsize(store.path("s")) == 0
+    write_lines(store, "s", [f"line {i:02}" for i in range(13, 26)])
+    store.rotate_all()
+    write_lines(store, "s", [f"line {i:02}" for i in range(26, 29)])
+    assert store.tail("s", 5) == [f"line {i:02}" for i in range(24, 29)]
+    # Oldest backup first, then the newer one, then the live file; each backup lost
+    # the one line that didn't fit in max_bytes
+    expected = [f"line {i:02}" for i in range(29) if i not in (0, 13)]
+    assert store.tail("s", 100) == expected
+    assert store.tail("s", 17) == expected[-17:]
+
+
+def test_tail_stops_at_missing_backup(store):
+    write_lines(store, "s", ["old"])
+    assert store.tail("s", 10) == ["old"]
+    assert store.tail("missing", 10) == []
+
+
+def test_rotation_keeps_only_max_bytes_from_a_line_start(store):
+    write_lines(store, "s", [f"line {i:02}" for i in range(50)])
+    store.rotate_all()
+    backup = open(store.path("s") + ".1").read()
+    assert len(backup) <= store.max_bytes
+    assert backup.startswith("line ") and backup.endswith("line 49\n")
+    assert store.tail("s", 3) == ["line 47", "line 48", "line 49"]
+
+
+def test_oldest_backup_is_dropped(store):
+    for batch in range(3):
+        write_lines(store, "s", [f"batch {batch} line {i:02}" for i in range(8)])
+        store.rotate_all()
+    assert not os.path.exists(store.path("s") + ".3")
+    lines = store.tail("s", 100)
+    assert lines[0].startswith("batch 1") and lines[-1] == "batch 2 line 07"
+
+
+def test_small_files_are_not_rotated(store):
+    write_lines(store, "s", ["short"])
+    store.rotate_all()
+    assert not os.path.exists(store.path("s") + ".1")
+    assert store.tail("s", 1) == ["short"]
@@ -0,0 +1,167 @@
+import threading
+import time
+
+from outbox import Outbox, ProgressMessage
+
+
+class Message:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class ApiError(Exception):
+    def __init__(self, error_code, retry_after=None):
+        super().__init__(f"Error code: {error_code}")
+        self.error_code = error_code
+        self.result_json = {"parameters": {"retry_after": retry_after}} if retry_after is not None else {}
+
+
+class FakeTransport:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.ids = iter(range(1, 1000000))
+
+    def fail(self, text, error):
+        # The first send of this text raises error
+        self.failures[text] = error
+
+    def call(self, method, kwargs):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append((time.monotonic(), method, dict(kwargs)))
+            error = self.failures.pop(kwargs.get("text"), None)
+            if error is not None:
+                raise error
+            return Message(next(self.ids))
+
+    def texts(self, chat_id=None):
+        return [kwargs["text"] for _, _, kwargs in self.calls if chat_id is None or kwargs.get("chat_id") == chat_id]
+
+
+def make_outbox(transport, **kwargs):
+    options = dict(global_rate=1000.0, chat_rate=1000.0, chat_burst=1000, workers=4)
+    options.update(kwargs)
+    return Outbox(transport, **options)
+
+
+def test_messages_keep_per_chat_order():
+    transport = FakeTransport(delay=0.002)
+    outbox = make_outbox(transport)
+    outbox.start()
+    for i in range(20):
+        for chat_id in (1, 2, 3):
+            outbox.send_message(chat_id, f"{chat_id}-{i}")
+    assert outbox.join(timeout=10)
+    for chat_id in (1, 2, 3):
+        assert transport.texts(chat_id) == [f"{chat_id}-{i}" for i in range(20)]
+
+
+def test_one_request_in_flight_per_chat():
+    active = {}
+    overlaps = []
+
+    class Transport(FakeTransport):
+        def call(self, method, kwargs):
+            chat_id = kwargs["chat_id"]
+            with self.lock:
+                active[chat_id] = active.get(chat_id, 0) + 1
+                if active[chat_id] > 1:
+                    overlaps.append(chat_id)
+            try:
+                return super().call(method, kwargs)
+            finally:
+                with self.lock:
+                    active[chat_id] -= 1
+
+    outbox = make_outbox(Transport(delay=0.002))
+    outbox.start()
+    for i in range(10):
+        for chat_id in (1, 2):
+            outbox.send_message(chat_id, str(i))
+    assert outbox.join(timeout=10)
+    assert overlaps == []
+
+
+def test_queued_edits_coalesce():
+    transport = FakeTransport()
+    outbox = make_outbox(transport)
+    # Not started yet, so everything stays queued
+    for i in range(5):
+        outbox.edit_message_text(f"step {i}", chat_id=1, message_id=7)
+    outbox.edit_message_text("other", chat_id=1, message_id=8)
+    outbox.start()
+    assert outbox.join(timeout=10)
+    assert transport.texts() == ["step 4", "other"]
+    assert outbox.stats["coalesced"] == 4
+
+
+def test_edit_after_send_is_not_coalesced():
+    transport = FakeTransport(delay=0.05)
+    outbox = make_outbox(transport, workers=1)
+    outbox.start()
+    outbox.edit_message_text("first", chat_id=1, message_id=7)
+    time.sleep(0.02)
+    # The first edit is in flight now; this one must still go out
+    outbox.edit_message_text("second", chat_id=1, message_id=7)
+    assert outbox.join(timeout=10)
+    assert transport.texts() == ["first", "second"]
+
+
+def test_progress_message_holds_updates_until_sent():
+    transport = FakeTransport(delay=0.05)
+    outbox = make_outbox(transport)
+    outbox.start()
+    progress = ProgressMessage(outbox, 1, "starting")
+    progress.update("half way")
+    progress.update("done")
+    time.sleep(0.2)
+    assert outbox.join(timeout=10)
+    assert transport.calls[0][1] == "send_message"
+    assert [(method, kwargs["text"]) for _, method, kwargs in transport.calls[1:]] == [("edit_message_text", "done")]
+    assert transport.calls[1][2]["message_id"] == 1
+
+
+def test_429_waits_retry_after_and_keeps_order():
+    transport = FakeTransport()
+    transport.fail("a", ApiError(429, retry_after=1))
+    outbox = make_outbox(transport)
+    outbox.start()
+    outbox.send_message(1, "a")
+    outbox.send_message(1, "b")
+    outbox.send_message(2, "c")
+    assert outbox.join(timeout=10)
+    assert transport.texts(1) == ["a", "a", "b"]
+    times = {}
+    for at, _, kwargs in transport.calls:
+        times.setdefault(kwargs["text"], []).append(at)
+    assert times["a"][1] - times["a"][0] >= 0.9
+    # Other chats aren't held up by one chat's retry_after
+    assert times["c"][0] < times["a"][1]
+    assert outbox.stats["retried"] == 1
+
+
+def test_client_errors_are_dropped():
+    transport = FakeTransport()
+    transport.fail("bad", ApiError(400))
+    outbox = make_outbox(transport)
+    outbox.start()
+    outbox.send_message(1, "bad")
+    outbox.send_message(1, "next")
+    assert outbox.join(timeout=10)
+    assert transport.texts() == ["bad", "next"]
+    assert outbox.stats["dropped"] == 1
+
+
+def test_chat_rate_limit():
+    transport = FakeTransport()
+    outbox = make_outbox(transport, chat_rate=20.0, chat_burst=2)
+    outbox.start()
+    started = time.monotonic()
+    for i in range(6):
+        outbox.send_message(1, str(i))
+    assert outbox.join(timeout=10)
+    # Two go out at once from the burst, the other four at 20/s
+    assert time.monotonic() - started >= 0.15
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronSchedule
+
+
+def test_step_from_wildcard():
+    schedule = CronSchedule("*/15 * * * *")
+    assert schedule.next_after(datetime(2026, 10, 18, 10, 7)) == datetime(2026, 10, 18, 10, 15)
+    assert schedule.next_after(datetime(2026, 10, 18, 10, 45)) == datetime(2026, 10, 18, 11, 0)
+
+
+def test_step_from_start_value():
+    # "5/20" is every 20 minutes starting at 5
+    schedule = CronSchedule("5/20 * * * *")
+    assert schedule.next_after(datetime(2026, 10, 18, 10, 26)) == datetime(2026, 10, 18, 10, 45)
+    assert schedule.next_after(datetime(2026, 10, 18, 10, 50)) == datetime(2026, 10, 18, 11, 5)
+
+
+def test_step_within_range():
+    schedule = CronSchedule("0 9-17/4 * * *")
+    assert schedule.hours == {9, 13, 17}
+    assert schedule.next_after(datetime(2026, 10, 18, 17, 0)) == datetime(2026, 10, 19, 9, 0)
+
+
+def test_next_after_is_strictly_later():
+    schedule = CronSchedule("30 12 * * *")
+    assert schedule.next_after(datetime(2026, 10, 18, 12, 30)) == datetime(2026, 10, 19, 12, 30)
+    assert schedule.next_after(datetime(2026, 10, 18, 12, 29, 59)) == datetime(2026, 10, 18, 12, 30)
+
+
+def test_day_of_month_or_day_of_week():
+    # Both restricted: the 13th or any Friday fires
+    schedule = CronSchedule("0 0 13 * 5")
+    runs = []
+    when = datetime(2026, 10, 1)
+    for _ in range(4):
+        when = schedule.next_after(when)
+        runs.append(when.date().isoformat())
+    assert runs == ["2026-10-02", "2026-10-09", "2026-10-13", "2026-10-16"]
+
+
+def test_only_day_of_week_restricted():
+    schedule = CronSchedule("0 8 * * 1")
+    # 2026-10-18 is a Sunday
+    assert schedule.next_after(datetime(2026, 10, 18, 9, 0)) == datetime(2026, 10, 19, 8, 0)
+
+
+def test_sunday_as_seven():
+    assert CronSchedule("0 0 * * 7").weekdays == {0}
+    assert CronSchedule("0 0 * * 7").next_after(datetime(2026, 10, 14)) == datetime(2026, 10, 18)
+
+
+def test_leap_day():
+    schedule = CronSchedule("0 0 29 2 *")
+    assert schedule.next_after(datetime(2026, 3, 1)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize("expression", ["0 0 30 2 *", "0 0 31 4,6,9,11 *"])
+def test_schedule_that_never_fires(expression):
+    assert CronSchedule(expression).next_after(datetime(2026, 10, 18)) is None
+
+
+def test_macro():
+    assert CronSchedule("@daily").expression == "0 0 * * *"
+
+
+@pytest.mark.parametrize("expression", ["*/0 * * * *", "60 * * * *", "0 0 * *", "5-1 * * * *", "x * * * *"])
+def test_invalid_expression(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
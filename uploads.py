@@ -0,0 +1,64 @@
+import hashlib
+import os
+import tempfile
+
+import requests
+from telebot import apihelper
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class ContentStore:
+    def __init__(self, root, max_bytes=5 * 1024 * 1024, chunk_size=64 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.tmp_dir = os.path.join(root, ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, digest, suffix=".py"):
+        return os.path.join(self.root, "objects", digest[:2], digest + suffix)
+
+    def save_stream(self, chunks, suffix=".py"):
+        # Hash while writing, then publish atomically under the content hash
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(size)
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            path = self.path(digest.hexdigest(), suffix)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), path, size
+
+    def download(self, token, file_path, suffix=".py"):
+        # Same URL and proxy as telebot's download_file, but streamed in chunks
+        if apihelper.FILE_URL is None:
+            url = f"https://api.telegram.org/file/bot{token}/{file_path}"
+        else:
+            url = apihelper.FILE_URL.format(token, file_path)
+        with requests.get(url, stream=True, proxies=apihelper.proxy,
+                          timeout=(apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise UploadTooLarge(int(length))
+            return self.save_stream(response.iter_content(self.chunk_size), suffix)